@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from ...faiss_index import index_manager, IndexArtifactError
+from ...cache import recommendation_cache, search_cache
+from ...models import User
+from ...api.auth import get_current_admin
+
+router = APIRouter(prefix="/admin")
+
+
+@router.get("/index/versions",
+            summary="Listar las versiones del índice FAISS",
+            description="Retorna las versiones del índice guardadas en disco, marcando la que está en uso.",
+            tags=["Admin"]
+            )
+async def read_index_versions(current_user: User = Depends(get_current_admin)) -> List[dict]:
+    return index_manager.versions()
+
+
+@router.post("/index/rollback",
+             summary="Volver a una versión anterior del índice FAISS",
+             description="Sirve de nuevo la versión indicada, o la anterior a la actual si no se indica ninguna, sin reiniciar el servidor.",
+             tags=["Admin"]
+             )
+async def rollback_index(version: Optional[str] = None, current_user: User = Depends(get_current_admin)):
+    try:
+        loaded = index_manager.rollback(version)
+    except IndexArtifactError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    return {"version": loaded.version, "vectors": loaded.index.ntotal}
+
+
+@router.get("/cache/recommendations",
+            summary="Estadísticas de la caché de recomendaciones",
+            description="Retorna el tamaño, los aciertos y los fallos de la caché de recomendaciones de este worker.",
+            tags=["Admin"]
+            )
+async def read_recommendation_cache_stats(current_user: User = Depends(get_current_admin)) -> dict:
+    return recommendation_cache.stats()
+
+
+@router.get("/cache/search",
+            summary="Estadísticas de la caché de búsquedas por título",
+            description="Retorna el tamaño estimado en bytes (weight), los aciertos, los fallos y los segundos de búsqueda ahorrados (saved_cost) de la caché de búsquedas de este worker.",
+            tags=["Admin"]
+            )
+async def read_search_cache_stats(current_user: User = Depends(get_current_admin)) -> dict:
+    return search_cache.stats()
@@ -1,17 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.crud import get_game, get_game_by_title_exact, get_games_by_similar_title, faiss_trainer, get_game, get_games_predictions
-from ...schemas import GameRead, GameCreate, GameUpdate, GameDetails
-from ...dependencies import get_db, get_async_db
+from app.crud import get_game, get_game_by_title_exact, get_games_by_similar_title, get_game, get_games_predictions, get_similar_games, get_title_suggestions, browse_games, search_games_full_text
+from app.trainer import training_jobs
+from ...schemas import GameRead, GameCreate, GameUpdate, GameDetails, TrainingJobRead, GameSuggestion, GameBrowse, GameSearchPage
+from ...dependencies import get_async_db
+from ...config import settings
 
 router = APIRouter()
 
 #Get one game by id
 @router.get("/{game_id}", response_model=GameRead, tags=["Games"])
-def read_game(game_id: int, db: Session = Depends(get_db)):
-    db_game = get_game(db, game_id=game_id)
+async def read_game(game_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_game = await get_game(db, game_id=game_id)
     if db_game is None:
         raise HTTPException(status_code=404, detail="Game not found")
     return db_game
@@ -19,8 +20,8 @@ def read_game(game_id: int, db: Session = Depends(get_db)):
 
 #Get one game by title
 @router.get("/title/{title}", response_model=GameRead, tags=["Games"])
-def read_game_by_title(title: str, db: Session = Depends(get_db)):
-    db_game = get_game_by_title_exact(db, title=title)
+async def read_game_by_title(title: str, db: AsyncSession = Depends(get_async_db)):
+    db_game = await get_game_by_title_exact(db, title=title)
     if db_game is None:
         raise HTTPException(status_code=404, detail="Game not found")
     return db_game
@@ -33,13 +34,71 @@ async def read_games_by_title(title: str, limit: int = Query(20, alias="limit"),
     return db_games
 
 
+# Full-text search of title, developer and publisher, paged: "souls fromsoftware"
+# finds the games of that developer with souls in the title
+@router.get("/games/search", response_model=GameSearchPage, tags=["Games"])
+async def read_games_full_text(q: str = Query(..., min_length=1), offset: int = Query(0, ge=0),
+                               limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    return await search_games_full_text(db, q, offset=offset, limit=limit)
+
+
+# Suggestions while the user types, served from memory: titles with a word
+# starting with prefix, most popular first
+@router.get("/games/autocomplete/{prefix}", response_model=List[GameSuggestion], tags=["Games"])
+async def read_title_suggestions(prefix: str, limit: int = Query(settings.autocomplete_top_n, ge=1, le=settings.autocomplete_top_n)):
+    suggestions = get_title_suggestions(prefix, limit=limit)
+    if suggestions is None:
+        raise HTTPException(status_code=503, detail="Suggestions are not available yet")
+    return suggestions
+
+
+# Games by genre, engine, award and steam_rating bucket ("80-90"): repeated
+# values of a filter are alternatives, different filters all apply. The
+# response counts the games of every value, for the filter menus.
+@router.get("/games/browse", response_model=GameBrowse, tags=["Games"])
+async def read_games_browse(genre: List[str] = Query([]), engine: List[str] = Query([]),
+                            award: List[str] = Query([]), rating: List[str] = Query([]),
+                            offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100),
+                            db: AsyncSession = Depends(get_async_db)):
+    filters = {"genre": genre, "engine": engine, "award": award, "rating": rating}
+    try:
+        page = await browse_games(db, filters, offset=offset, limit=limit)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if page is None:
+        raise HTTPException(status_code=503, detail="Browsing is not available yet")
+    return page
+
+
+# Stages that run out of their time budget are completed with popular games,
+# such responses carry X-Partial-Result: true
 @router.get("/games/predictions/{user_nickname}", response_model=List[GameRead], tags=["Games"])
-async def read_games_predictions(user_nickname: str, k: int = 20, db: AsyncSession = Depends(get_async_db)):
-    db_games = await get_games_predictions(db, user_nickname = user_nickname, k=k)
+async def read_games_predictions(user_nickname: str, response: Response, k: int = 20, db: AsyncSession = Depends(get_async_db)):
+    db_games, partial = await get_games_predictions(db, user_nickname = user_nickname, k=k)
+    if partial:
+        response.headers["X-Partial-Result"] = "true"
+    return db_games
+
+
+# Kept after /games/search/{title}, a search for "similar" would match this route
+@router.get("/games/{game_id}/similar", response_model=List[GameRead], tags=["Games"])
+async def read_similar_games(game_id: int, k: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    db_games = await get_similar_games(db, game_id=game_id, k=k)
+    if db_games is None:
+        raise HTTPException(status_code=404, detail="Game not found")
     return db_games
 
 #train
-@router.post("/train", tags=["Games"])
-async def train(db: AsyncSession = Depends(get_async_db)):
-    await faiss_trainer(db)
-    return {"message": "Training complete"}
\ No newline at end of file
+# Training runs in the background, the response carries the job to poll.
+# incremental=true only re-encodes the games changed since the last build.
+@router.post("/train", response_model=TrainingJobRead, status_code=status.HTTP_202_ACCEPTED, tags=["Games"])
+async def train(incremental: bool = False):
+    return training_jobs.start(incremental=incremental)
+
+
+@router.get("/train/{job_id}", response_model=TrainingJobRead, tags=["Games"])
+async def read_training_job(job_id: str):
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from ...crud import add_review_by_nickname, get_user_reviews, delete_review, get_user_review
+from ...crud import add_review_by_nickname, get_user_reviews, delete_review, get_user_review, update_review
 from ...schemas import ReviewCreate
 from ...dependencies import get_async_db
 from ...models import User
@@ -74,7 +74,7 @@ async def delete_review_by_game_id_and_review(id:int, nickname:str, db: AsyncSes
             response_description="Retorna la reseña actualizada",
             tags=["Reviews"]
             )
-async def update_review(id:int, nickname:str, review: ReviewCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+async def update_review_by_game_id(id:int, nickname:str, review: ReviewCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     if current_user.nickname != nickname:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
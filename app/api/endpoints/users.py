@@ -1,11 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from ...crud import get_user_no_password, get_user_details, add_user, add_follower, get_user_followers_and_following, update_user_data, create_numpy_arrays, delete_follower, get_all_users
+from ...crud import get_user_no_password, verify_user_password, get_user_details, add_user, add_follower, get_user_followers_and_following, update_user_data, create_numpy_arrays, delete_follower, get_all_users
 from ...schemas import UserBase, UserRead, UserCreate, UserUpdate, UserDetails, UserFollower, FollowerDetails, Token
-from ...dependencies import get_db, get_async_db
+from ...dependencies import get_async_db
 from ...config import settings
 from datetime import datetime, timedelta
 from ...models import User
@@ -22,7 +21,7 @@ router = APIRouter()
             response_description="Retorna los datos del usuario (excepto la contraseña) con el nickname dado.",
             tags=["Users"]
 )
-async def read_user(nickname: str, db: Session = Depends(get_async_db)):
+async def read_user(nickname: str, db: AsyncSession = Depends(get_async_db)):
     db_user = await get_user_no_password(db, nickname=nickname)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -60,8 +59,8 @@ async def read_user_details(nickname: str, db: AsyncSession = Depends(get_async_
     response_description="Retorna los seguidores y seguidos de un usuario específico",
     tags=["Users"]
 )
-def read_user_followers_and_following(nickname: str, db: Session = Depends(get_db)):
-    db_user = get_user_followers_and_following(db, user_nickname=nickname)
+async def read_user_followers_and_following(nickname: str, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_followers_and_following(db, user_nickname=nickname)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -91,8 +90,8 @@ async def read_all_users(db: AsyncSession = Depends(get_async_db)):
     response_description="Retorna el username(nickname) del usuario registrado",
     tags=["Users"]
 )
-def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.nickname == user_data.nickname).first()
+async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_no_password(db, nickname=user_data.nickname)
     if db_user:
         raise HTTPException(status_code=400, detail="Nickname already registered")
     
@@ -122,7 +121,7 @@ def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
     if len(user_data.password) < 8:
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters long")
     
-    return add_user(db=db, user=user_data)
+    return await add_user(db=db, user=user_data)
 
 
 @router.put(
@@ -133,28 +132,26 @@ def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
     response_description="Retorna los datos del usuario actualizados",
     tags=["Users"]
 )
-def update_user(
+async def update_user(
     nickname: str, 
     user_data: UserUpdate, 
     password: str = Body(...),
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user: User = Depends(get_current_user)
 ):
     
-    print(current_user.nickname)
-    
     if current_user.nickname != nickname:
         raise HTTPException(status_code=403, detail="User not authorized")
     
-    db_user = db.query(User).filter(User.nickname == nickname).first()
+    db_user = await get_user_no_password(db, nickname=nickname)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if not db_user.verify_password(password):
+    if not await verify_user_password(db_user, password):
         raise HTTPException(status_code=400, detail="Password is incorrect")
 
     #if password is correct then update user data
-    updated_user = update_user_data(db=db, user_nickname=nickname, user=user_data)
+    updated_user = await update_user_data(db=db, user_nickname=nickname, user=user_data)
     if updated_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -169,13 +166,13 @@ def update_user(
     description="El usuario que sigue debe estar autenticado para seguir a alguien",
     tags=["Users"]
 )
-def create_follower(nickname: str, follower: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_follower(nickname: str, follower: str, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     
     if current_user.nickname != follower:
         raise HTTPException(status_code=403, detail="User not authorized")
     
-    db_user = get_user_no_password(db, nickname=nickname)
-    db_follower = get_user_no_password(db, nickname=follower)
+    db_user = await get_user_no_password(db, nickname=nickname)
+    db_follower = await get_user_no_password(db, nickname=follower)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     if db_follower is None:
@@ -183,7 +180,7 @@ def create_follower(nickname: str, follower: str, db: Session = Depends(get_db),
     
     user_data : UserFollower = UserFollower(user_follower_nickname=follower, user_following_nickname=nickname)
     
-    return add_follower(db=db, followerData=user_data)
+    return await add_follower(db=db, followerData=user_data)
 
 
 @router.delete(
@@ -211,9 +208,9 @@ async def delete_follower_by_nickname(nickname: str, follower: str, db: AsyncSes
 
 #Auth
 @router.post("/token", response_model=Token, tags=["AUTH"])
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.nickname == form_data.username).first()
-    if not user or not user.verify_password(form_data.password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_no_password(db, nickname=form_data.username)
+    if not user or not await verify_user_password(user, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -223,7 +220,6 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     access_token = create_access_token(
         data={"sub": user.nickname}, expires_delta=access_token_expires
     )
-    print(user, access_token)
     # Devuelve el access token, el tipo de token, y el nickname del usuario
     return {"access_token": access_token, "token_type": "bearer", "nickname": user.nickname}
 
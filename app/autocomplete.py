@@ -0,0 +1,122 @@
+import asyncio
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .catalog import catalog_watcher
+from .config import settings
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+# Sorts after every character of a normalized title
+END = "\uffff"
+
+
+# Lowercase, accents removed, words separated by single spaces
+def normalize_title(title: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", title.lower())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return NON_ALPHANUMERIC.sub(" ", stripped).strip()
+
+
+# One build of the suggestions. build() replaces the whole snapshot and
+# suggest() reads it once, so it never mixes positions of two builds.
+@dataclass(frozen=True)
+class AutocompleteSnapshot:
+    # Games by popularity, the positions of owners and table
+    ids: np.ndarray
+    titles: List[str]
+    # Sorted normalized title suffixes and the game position of each
+    keys: List[str]
+    owners: np.ndarray
+    table: Dict[str, np.ndarray]
+    built_at: float
+
+
+# Typeahead suggestions: the games with a title word starting with the typed
+# text, most popular first. "wild hu" matches "The Witcher 3: Wild Hunt".
+#
+# Every title is stored once per word, as the normalized title from that word
+# on, in one sorted list. The keys starting with a prefix are then a
+# contiguous range found by bisect. Games are numbered by popularity (best
+# steam_rating first, as popular.py), so the top of a range is its smallest
+# distinct numbers. Ranges of prefixes up to table_length characters span a
+# large part of the catalog and their top_n is precomputed.
+class TitleAutocomplete:
+    def __init__(self, top_n: int = 10, table_length: int = 3):
+        self.top_n = top_n
+        self.table_length = table_length
+        self.snapshot: Optional[AutocompleteSnapshot] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    # rows are (id, title), most popular first
+    def build(self, rows: Sequence[Tuple[int, str]]):
+        entries = []
+        for position, (_, title) in enumerate(rows):
+            words = normalize_title(title or "").split()
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), position))
+        entries.sort()
+        keys = [key for key, _ in entries]
+        owners = np.fromiter((position for _, position in entries), dtype=np.int32, count=len(entries))
+
+        table = {}
+        for length in range(1, self.table_length + 1):
+            start = 0
+            while start < len(keys):
+                prefix = keys[start][:length]
+                if len(prefix) < length:
+                    start += 1
+                    continue
+                end = bisect_left(keys, prefix + END, start)
+                table[prefix] = self._top(owners[start:end])
+                start = end
+
+        self.snapshot = AutocompleteSnapshot(
+            ids=np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+            titles=[row[1] for row in rows], keys=keys, owners=owners, table=table,
+            built_at=time.time(),
+        )
+
+    def _top(self, owners: np.ndarray) -> np.ndarray:
+        return np.unique(owners)[:self.top_n]
+
+    # (game id, title) of up to limit suggestions, at most top_n
+    def suggest(self, text: str, limit: Optional[int] = None) -> List[Tuple[int, str]]:
+        snapshot = self.snapshot
+        prefix = normalize_title(text)
+        if snapshot is None or not prefix:
+            return []
+        top = snapshot.table.get(prefix)
+        if top is None:
+            if len(prefix) <= self.table_length:
+                return []
+            keys = snapshot.keys
+            start = bisect_left(keys, prefix)
+            end = bisect_left(keys, prefix + END, start)
+            top = self._top(snapshot.owners[start:end])
+        ids, titles = snapshot.ids, snapshot.titles
+        return [(int(ids[position]), titles[position]) for position in top[:limit].tolist()]
+
+    # Rebuilt by the catalog watcher whenever the games change
+    async def refresh(self, db: AsyncSession):
+        result = await db.execute(
+            select(models.Game.id, models.Game.title)
+            .order_by(models.Game.steam_rating.desc().nulls_last(), models.Game.id)
+        )
+        rows = result.all()
+        await asyncio.get_running_loop().run_in_executor(None, self.build, rows)
+
+
+title_autocomplete = TitleAutocomplete(settings.autocomplete_top_n, settings.autocomplete_table_length)
+catalog_watcher.add_listener(title_autocomplete.refresh)
@@ -0,0 +1,203 @@
+import json
+import os
+
+import faiss
+import numpy as np
+
+from .encoder import GameEncoder
+
+BINARY_INDEX_FILE = "games.bindex"
+BINARY_DATA_FILE = "binary.npz"
+BINARY_META_FILE = "binary.json"
+
+# Popcount of every byte value, numpy 1.26 has no bitwise_count
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+# Compact alternative to the float32 game vectors (settings.faiss_binary).
+#
+# Apart from the rating and the 0.1 primary genre, GameEncoder vectors are 0/1
+# one-hot blocks, and between 0/1 vectors the squared L2 distance is the
+# Hamming distance. Codes hold, bit-packed:
+#   - the genres, engines and awards blocks, each bit repeated rating_bits + 3
+#     times so that one mismatch there outweighs everything after it,
+#   - the primary genre one-hot,
+#   - a thermometer-coded rating bucket (rating_bits bits, the Hamming
+#     distance between two buckets is how far apart they are).
+# Without the repetition a rating or primary genre bit would count as much as
+# a genre, while in the float distance they only order games whose genres,
+# engines and awards are the same, and catalogs have large groups of those.
+#
+# A binary FAISS index searches the codes for a shortlist of rerank_factor * k
+# games, which is re-ranked with the exact L2 distance of the float vectors,
+# rebuilt from the codes plus the stored rating and primary genre of each game.
+# Without nlist the index is an IndexBinaryFlat holding the codes in id order,
+# its labels are positions and the re-ranking reads the codes in place, so
+# they are stored once. BIVF keeps its codes in inverted lists and a sorted
+# copy is kept next to it.
+#
+# Exposes the part of the faiss.Index interface the application uses (train,
+# add_with_ids, remove_ids, search, d, ntotal), taking the float vectors of
+# GameEncoder.encode.
+class BinaryGameIndex:
+    def __init__(self, encoder: GameEncoder, nlist: int = 0, rating_bits: int = 3, rerank_factor: int = 16):
+        self.encoder = encoder
+        self.d = encoder.dimension
+        self.nlist = nlist
+        self.rating_bits = rating_bits
+        self.rerank_factor = rerank_factor
+        self.one_hot_columns = np.arange(encoder.genres_offset, encoder.dimension)
+        self.primary_genre_columns = np.arange(encoder.primary_genre_offset, encoder.genres_offset)
+        # Every one-hot bit is repeated so that a one-hot mismatch always costs
+        # more than the widest rating plus primary genre difference
+        self.repeat = rating_bits + 3
+        self.one_hot_bits = len(self.one_hot_columns) * self.repeat
+        self.primary_genre_start = self.one_hot_bits
+        self.rating_start = self.primary_genre_start + len(self.primary_genre_columns)
+        # Codes are whole bytes
+        self.code_bits = -(-(self.rating_start + rating_bits) // 8) * 8
+        self.one_hot_mask = np.packbits(np.arange(self.code_bits) < self.one_hot_bits)
+        self.index = self._create_index()
+        self.nprobe = 1
+        # Sorted by id, for the exact re-ranking
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.codes = np.zeros((0, self.code_bits // 8), dtype=np.uint8)
+        self.ratings = np.zeros(0, dtype=np.float32)
+        self.primary_genres = np.zeros(0, dtype=np.int16)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def is_trained(self) -> bool:
+        return self.index.is_trained
+
+    @property
+    def nprobe(self) -> int:
+        return self._nprobe
+
+    @nprobe.setter
+    def nprobe(self, nprobe: int):
+        self._nprobe = nprobe
+        if self.nlist:
+            self.index.nprobe = nprobe
+
+    def train(self, vectors: np.ndarray):
+        self.index.train(self.encode_codes(vectors))
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        codes = self.encode_codes(vectors)
+        if self.nlist:
+            self.index.add_with_ids(codes, ids)
+        self._store(
+            np.concatenate([self.ids, ids]),
+            np.concatenate([self.codes, codes]),
+            np.concatenate([self.ratings, vectors[:, 0]]),
+            np.concatenate([self.primary_genres, self._primary_genres(vectors)]),
+        )
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        keep = ~np.isin(self.ids, ids)
+        if self.nlist:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+        self._store(self.ids[keep], self.codes[keep], self.ratings[keep], self.primary_genres[keep])
+        return int((~keep).sum())
+
+    def search(self, vectors: np.ndarray, k: int):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        shortlist = min(max(k, k * self.rerank_factor), max(self.ntotal, 1))
+        _, labels = self.index.search(self.encode_codes(vectors), shortlist)
+
+        found = labels >= 0
+        if self.nlist:
+            positions = np.searchsorted(self.ids, np.where(found, labels, 0))
+            positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        else:
+            positions = np.where(found, labels, 0)
+            labels = np.where(found, self.ids[positions] if len(self.ids) else -1, -1)
+        distances = self._exact_distances(vectors, positions)
+        distances[~found] = np.inf
+
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        labels = np.where(np.isinf(distances), -1, np.take_along_axis(labels, order, axis=1))
+        if labels.shape[1] < k:
+            # Fewer stored games than asked for, padded like FAISS does
+            padding = k - labels.shape[1]
+            labels = np.pad(labels, ((0, 0), (0, padding)), constant_values=-1)
+            distances = np.pad(distances, ((0, 0), (0, padding)), constant_values=np.inf)
+        return distances.astype(np.float32), labels
+
+    def encode_codes(self, vectors: np.ndarray) -> np.ndarray:
+        bits = np.zeros((len(vectors), self.code_bits), dtype=bool)
+        bits[:, :self.one_hot_bits] = np.repeat(vectors[:, self.one_hot_columns] > 0, self.repeat, axis=1)
+        bits[:, self.primary_genre_start:self.rating_start] = vectors[:, self.primary_genre_columns] > 0
+        if self.rating_bits:
+            # Ratings are encoded as steam_rating * 0.008, up to 0.8
+            buckets = np.clip((vectors[:, 0] / 0.8 * (self.rating_bits + 1)).astype(int), 0, self.rating_bits)
+            bits[:, self.rating_start:self.rating_start + self.rating_bits] = np.arange(self.rating_bits) < buckets[:, None]
+        return np.packbits(bits, axis=1)
+
+    def clone(self) -> "BinaryGameIndex":
+        copy = BinaryGameIndex(self.encoder, self.nlist, self.rating_bits, self.rerank_factor)
+        if self.nlist:
+            copy.index = faiss.clone_binary_index(self.index)
+        copy.nprobe = self.nprobe
+        copy._store(self.ids.copy(), self.codes.copy(), self.ratings.copy(), self.primary_genres.copy())
+        return copy
+
+    def write(self, directory: str):
+        if self.nlist:
+            faiss.write_index_binary(self.index, os.path.join(directory, BINARY_INDEX_FILE))
+        np.savez(os.path.join(directory, BINARY_DATA_FILE), ids=self.ids, codes=self.codes,
+                 ratings=self.ratings, primary_genres=self.primary_genres)
+        with open(os.path.join(directory, BINARY_META_FILE), "w") as meta_file:
+            json.dump({"nlist": self.nlist, "rating_bits": self.rating_bits, "rerank_factor": self.rerank_factor}, meta_file)
+
+    @classmethod
+    def read(cls, directory: str, encoder: GameEncoder) -> "BinaryGameIndex":
+        with open(os.path.join(directory, BINARY_META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        index = cls(encoder, **meta)
+        if index.nlist:
+            index.index = faiss.read_index_binary(os.path.join(directory, BINARY_INDEX_FILE))
+        with np.load(os.path.join(directory, BINARY_DATA_FILE)) as data:
+            index._store(data["ids"], data["codes"], data["ratings"], data["primary_genres"])
+        return index
+
+    def _create_index(self):
+        if self.nlist:
+            return faiss.index_binary_factory(self.code_bits, f"BIVF{self.nlist}")
+        return faiss.IndexBinaryFlat(self.code_bits)
+
+    def _store(self, ids, codes, ratings, primary_genres):
+        order = np.argsort(ids, kind="stable")
+        self.ids, self.codes = ids[order], codes[order]
+        self.ratings, self.primary_genres = ratings[order], primary_genres[order]
+        if not self.nlist:
+            # Rebuilt in id order, then the codes are a view of its storage
+            self.index.reset()
+            self.index.add(self.codes)
+            if len(self.codes):
+                self.codes = faiss.rev_swig_ptr(self.index.xb.data(), self.codes.size).reshape(self.codes.shape)
+
+    def _primary_genres(self, vectors: np.ndarray) -> np.ndarray:
+        block = vectors[:, self.encoder.primary_genre_offset:self.encoder.genres_offset]
+        return np.where(block.any(axis=1), block.argmax(axis=1), -1).astype(np.int16)
+
+    # Squared L2 distance between the query vectors and the stored games at
+    # positions, the same value IndexFlatL2 gives for the float vectors
+    def _exact_distances(self, vectors: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        query_codes = self.encode_codes(vectors) & self.one_hot_mask
+        candidate_codes = self.codes[positions] & self.one_hot_mask
+        one_hot = POPCOUNT[query_codes[:, None, :] ^ candidate_codes].sum(axis=2, dtype=np.float32) / self.repeat
+
+        rating = (vectors[:, :1] - self.ratings[positions]) ** 2
+
+        # Each primary genre is a single 0.1 entry
+        query_primary = self._primary_genres(vectors)[:, None]
+        candidate_primary = self.primary_genres[positions]
+        differ = query_primary != candidate_primary
+        primary = 0.01 * (differ * ((query_primary >= 0).astype(np.float32) + (candidate_primary >= 0)))
+        return one_hot + rating + primary
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from .config import settings
+
+_MISSING = object()
+
+
+# In-process LRU cache with an optional time to live and hit/miss counters.
+# Lookups run on the event loop, but invalidation can come from the training
+# thread when a new index version is published, hence the lock.
+# With a weigher, max_size bounds the summed weight of the values (such as
+# their estimated bytes) instead of their number. A value may be stored with
+# the cost of computing it, and the cost of every hit adds up in stats().
+class LRUCache:
+    def __init__(self, max_size: int, ttl: float = 0, weigher: Optional[Callable[[Any], int]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.weigher = weigher
+        self.hits = 0
+        self.misses = 0
+        self.saved_cost = 0.0
+        self._weight = 0
+        # key: (value, expires at, weight, cost)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and self.ttl and time.monotonic() > entry[1]:
+                self._remove(key)
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_cost += entry[3]
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, cost: float = 0.0):
+        weight = self.weigher(value) if self.weigher else 1
+        if self.max_size <= 0 or weight > self.max_size:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at, weight, cost)
+            self._weight += weight
+            while self._weight > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._weight -= entry[2]
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_matching(self, predicate: Callable[[Hashable], bool]):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "saved_cost": round(self.saved_cost, 3),
+        }
+        if self.weigher:
+            stats["weight"] = self._weight
+        return stats
+
+
+# Rough bytes held by a list of games: their strings plus a fixed overhead
+# per object and field
+def estimate_games_size(games: list) -> int:
+    size = 64
+    for game in games:
+        fields = game.__dict__.values()
+        size += 64 + 72 * len(fields) + sum(len(value) for value in fields if isinstance(value, str))
+    return size
+
+
+# Recommendations per (user nickname, k): (index version, games)
+recommendation_cache = LRUCache(settings.recommendation_cache_size, settings.recommendation_cache_ttl)
+
+# Title search results per (sorted query words, max distance, limit), with
+# the seconds the search took as their cost
+search_cache = LRUCache(int(settings.search_cache_megabytes * 2 ** 20), settings.search_cache_ttl, estimate_games_size)
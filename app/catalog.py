@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# Watches the games table for changes, through its row count and latest
+# updated_at: adding, editing or deleting a game changes one of them. The
+# listeners (rebuilding the in-memory title structures, dropping cached
+# searches) run in registration order when it changed, and run again at the
+# next check if one of them failed.
+class CatalogWatcher:
+    def __init__(self):
+        self.signature = None
+        self._listeners: List[Callable[[AsyncSession], Awaitable[None]]] = []
+
+    def add_listener(self, listener: Callable[[AsyncSession], Awaitable[None]]):
+        self._listeners.append(listener)
+
+    async def check(self, db: AsyncSession) -> bool:
+        result = await db.execute(select(func.count(models.Game.id), func.max(models.Game.updated_at)))
+        signature = tuple(result.one())
+        if signature == self.signature:
+            return False
+        for listener in self._listeners:
+            await listener(db)
+        self.signature = signature
+        return True
+
+
+catalog_watcher = CatalogWatcher()
+
+
+# Started with the application, runs until it shuts down
+async def watch_catalog_periodically(interval: float):
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                if await catalog_watcher.check(db):
+                    logger.info("Catalog changed: %d games, last updated at %s", *catalog_watcher.signature)
+        except Exception:
+            logger.exception("Could not refresh the catalog structures")
+        await asyncio.sleep(interval)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Date, null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .config import settings
+from .cooccurrence import CooccurrenceModel
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Reviews rated above this are liked games, as the seeds of a prediction
+LIKED_RATING = 7
+
+
+# Model of the workers: read from collaborative_path, and read again when a
+# rebuild replaces the file. Deltas applied by this worker are dropped then,
+# the rebuild read them from the database.
+class CollaborativeManager:
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._model: Optional[CooccurrenceModel] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    # None while no model has been built
+    def get(self) -> Optional[CooccurrenceModel]:
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return self._model
+            if mtime != self._mtime:
+                with self._lock:
+                    try:
+                        self._model = CooccurrenceModel.load(self.path, settings.collaborative_merge_pairs)
+                        self._mtime = mtime
+                    except Exception:
+                        logger.exception("Could not load the collaborative model %s", self.path)
+        return self._model
+
+    # Folds the deltas of a model in the default executor once enough piled
+    # up. Review writes do not wait for it.
+    def merge_if_due(self, model: CooccurrenceModel):
+        if model.merge_due:
+            merge = asyncio.get_running_loop().run_in_executor(None, model.merge)
+            merge.add_done_callback(self._log_merge_failure)
+
+    @staticmethod
+    def _log_merge_failure(merge: asyncio.Future):
+        if not merge.cancelled() and merge.exception() is not None:
+            logger.error("Could not merge the collaborative deltas", exc_info=merge.exception())
+
+    def save(self, model: CooccurrenceModel):
+        model.save(self.path)
+        with self._lock:
+            self._model, self._mtime = model, os.path.getmtime(self.path)
+
+
+collaborative_manager = CollaborativeManager(settings.collaborative_path, settings.faiss_reload_interval)
+
+
+# Liked games of every user, most recent reviews first, then wishlists
+async def stream_liked_games(db: AsyncSession, chunk_size: int):
+    reviews = select(
+        models.Review.user_nickname, models.Review.game_id, models.Review.review_date.label("liked_on")
+    ).where(models.Review.rating > LIKED_RATING)
+    wishlist = select(
+        models.Users_wishlist.user_nickname, models.Users_wishlist.game_id, null().cast(Date).label("liked_on")
+    )
+    liked = union_all(reviews, wishlist).subquery()
+    query = (
+        select(liked.c.user_nickname, liked.c.game_id)
+        .order_by(liked.c.liked_on.desc().nulls_last())
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await db.stream(query)
+    async for rows in result.partitions(chunk_size):
+        yield rows
+
+
+# Rebuilds the model from reviews and wishlists, meant to run nightly:
+#
+#   python -m app.collaborative
+async def build_collaborative_model(db: AsyncSession) -> dict:
+    started = time.perf_counter()
+    users, games, nicknames = [], [], {}
+    async for rows in stream_liked_games(db, settings.train_chunk_size):
+        users.extend(nicknames.setdefault(row.user_nickname, len(nicknames)) for row in rows)
+        games.extend(row.game_id for row in rows)
+    model = CooccurrenceModel.build(np.asarray(users, dtype=np.int64), np.asarray(games, dtype=np.int64),
+                                   settings.collaborative_max_user_items, settings.collaborative_top_n)
+    model.merge_pairs = settings.collaborative_merge_pairs
+    collaborative_manager.save(model)
+    report = {
+        "version": model.version,
+        "users": len(nicknames),
+        "interactions": len(games),
+        "games": len(model.ids),
+        "pairs": int(model.matrix.nnz),
+        "megabytes": round((model.matrix.data.nbytes + model.matrix.indices.nbytes + model.matrix.indptr.nbytes) / 2 ** 20, 2),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info("Collaborative model written to %s: %s", settings.collaborative_path, report)
+    return report
+
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        print(await build_collaborative_model(db))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
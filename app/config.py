@@ -1,3 +1,4 @@
+from typing import List
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,8 +8,129 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str 
     time_to_expire: int
+    # Log every statement of the async engine, which serves all the endpoints
+    database_echo: bool = False
+
+    # FAISS
+    # Every build is written to its own directory under faiss_index_dir;
+    # faiss_index_path is the pre-versioning index, served until the first build
+    faiss_index_dir: str = "indexes"
+    faiss_keep_versions: int = 3
+    faiss_index_path: str = "games.index"
+    # Open the index read-only through mmap: every uvicorn worker on the host
+    # then shares the same page-cache pages instead of a private copy
+    faiss_mmap: bool = False
+    # How often (seconds) a worker checks the CURRENT pointer for a version
+    # published by another worker, 0 disables the check
+    faiss_reload_interval: float = 5.0
+    # Index type as a faiss.index_factory spec, {nlist} is replaced by
+    # faiss_nlist (capped by the training sample). benchmarks/bench_index_types.py
+    # measures recall and latency of the candidates.
+    faiss_index_factory: str = "IVF{nlist},Flat"
+    faiss_nlist: int = 670
+    # faiss.ParameterSpace string such as "nprobe=100" or "efSearch=128";
+    # when empty, IVF indexes search faiss_nprobe lists
+    faiss_search_params: str = ""
+    faiss_nprobe: int = 100
+    # Bit-packed one-hot codes searched by Hamming distance instead of float
+    # vectors (app/binary_index.py), faiss_index_factory is then ignored. The
+    # shortlist of rerank_factor * k games is re-ranked exactly.
+    # faiss_binary_nlist 0 searches every code.
+    faiss_binary: bool = False
+    faiss_binary_nlist: int = 0
+    faiss_binary_rating_bits: int = 3
+    faiss_binary_rerank_factor: int = 16
+    # Neighbours per game precomputed by app.neighbors
+    neighbors_k: int = 50
+
+    # Training: games are streamed from the database in chunks, and the IVF
+    # quantizer is trained on a random sample. train_buffer_mb caps the
+    # vectors held outside the index at any time.
+    train_chunk_size: int = 5000
+    train_sample_size: int = 50000
+    train_buffer_mb: int = 64
+
+    # Incremental updates fall back to a full retrain when the changed games
+    # exceed this fraction of the index, or when their mean distance to the
+    # IVF centroids exceeds the one measured at training time by this ratio
+    incremental_max_fraction: float = 0.1
+    incremental_drift_ratio: float = 1.5
+
+    # Per-user recommendations kept in memory by each worker. Review writes
+    # and index swaps invalidate them; the TTL bounds how long another
+    # worker's cached entry can lag behind a write it did not see.
+    recommendation_cache_size: int = 10000
+    recommendation_cache_ttl: float = 600
+
+    # A user's seed games (reviews, wishlist and similar titles) are collapsed
+    # into at most profile_max_queries FAISS queries. Reviews weigh their
+    # rating, wishlist entries profile_wishlist_weight, and similar titles
+    # profile_similar_weight times the review they were found from.
+    profile_max_queries: int = 8
+    profile_max_neighbours: int = 1000
+    profile_wishlist_weight: float = 8.0
+    profile_similar_weight: float = 0.5
+    # Reviews whose similar titles are added as seeds, best rated first
+    similar_titles_max_seeds: int = 50
+
+    # Item-item co-occurrence model of liked games (app/collaborative.py),
+    # rebuilt by python -m app.collaborative. Its scores are blended with the
+    # FAISS content scores: collaborative_weight 0 disables it, and its best
+    # collaborative_candidates games join the FAISS candidates.
+    collaborative_path: str = "collaborative.npz"
+    collaborative_weight: float = 0.3
+    collaborative_candidates: int = 100
+    # Most recent liked games counted per user, and co-liked games kept per game
+    collaborative_max_user_items: int = 500
+    collaborative_top_n: int = 200
+    # Review writes are applied as deltas, folded into the matrix past this
+    # many game pairs
+    collaborative_merge_pairs: int = 100000
+
+    # Time budgets (seconds) of the stages of a prediction: loading the seed
+    # games, expanding them with similar titles, searching candidates and
+    # hydrating them. A stage that runs out is abandoned and the response is
+    # completed from the popular games of the user's genres, flagged with an
+    # X-Partial-Result header. 0 disables a budget, as by default: set them
+    # from the stage latencies of the deployment, which
+    # benchmarks/bench_prediction_budget.py measures.
+    prediction_seeds_budget: float = 0
+    prediction_expansion_budget: float = 0
+    prediction_search_budget: float = 0
+    prediction_hydration_budget: float = 0
+    # Best rated games kept per primary genre for those responses, refreshed
+    # in the background every popular_refresh_interval seconds
+    popular_per_genre: int = 50
+    popular_refresh_interval: float = 600
+
+    # Title search
+    # Every catalog_check_interval seconds, the in-memory title structures are
+    # rebuilt and the cached searches dropped if the games changed
+    # (app/catalog.py)
+    catalog_check_interval: float = 60
+    # Fuzzy title search served from the in-memory trigram index
+    # (app/title_index.py) instead of a Levenshtein scan of the games table
+    title_search_index: bool = True
+    # Title queries that run in the database match lower(title) through the
+    # pg_trgm index of migrations/003_games_title_trgm.sql. Deployments with
+    # several nodes can turn title_search_index off and rely on it.
+    title_search_trgm: bool = False
+    # Typeahead suggestions (app/autocomplete.py): at most autocomplete_top_n
+    # per prefix, precomputed for prefixes up to autocomplete_table_length
+    # characters
+    autocomplete_top_n: int = 10
+    autocomplete_table_length: int = 3
+    # Title search results kept in memory by each worker, per normalized
+    # query and limit. search_cache_megabytes bounds their estimated size.
+    search_cache_megabytes: float = 32
+    search_cache_ttl: float = 300
+    # Width of the steam_rating buckets of /games/browse (app/facets.py)
+    facet_rating_bucket: int = 10
+
+    # Users allowed to call the /admin endpoints
+    admin_nicknames: List[str] = []
     
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
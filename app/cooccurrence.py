@@ -0,0 +1,231 @@
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+
+# Item-item co-occurrence model: matrix[i, j] counts the users who liked both
+# games i and j (app.collaborative builds it from reviews and wishlists),
+# counts[i] the users who liked i. A user is scored with one sparse
+# vector-matrix product over the games they liked, normalized as a cosine
+# similarity, so popular games do not outrank everything.
+#
+# Review writes arrive as deltas (pending) kept next to the matrix and folded
+# into it once they grow past merge_pairs (never when None). Rows keep their top_n games at
+# build time only, deltas are added as they come.
+#
+# A merge takes a second or so on large catalogs, so the caller runs it off
+# the event loop (merge_due). The lock is only held to take the pending
+# deltas and to swap in the result: meanwhile the deltas being folded
+# (merging) still count in scores, and new writes go to pending.
+class CooccurrenceModel:
+    def __init__(self, ids: np.ndarray, counts: np.ndarray, matrix: sp.csr_matrix, version: str = "",
+                 merge_pairs: Optional[int] = None):
+        self.ids = ids
+        self.counts = counts
+        self.matrix = matrix
+        self.version = version
+        self.merge_pairs = merge_pairs
+        self.pending: Dict[int, Counter] = defaultdict(Counter)
+        self.pending_counts: Counter = Counter()
+        self.pending_pairs = 0
+        self.merging: Dict[int, Counter] = {}
+        self.merging_counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, users: np.ndarray, games: np.ndarray, max_user_items: Optional[int] = None,
+              top_n: Optional[int] = None, block_size: int = 256) -> "CooccurrenceModel":
+        users = np.asarray(users, dtype=np.int64)
+        games = np.asarray(games, dtype=np.int64)
+        ids, columns = np.unique(games, return_inverse=True)
+        _, rows = np.unique(users, return_inverse=True)
+
+        # One entry per user and game, in the given order (most recent first)
+        keys = rows * len(ids) + columns
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        rows, columns = rows[first], columns[first]
+        if max_user_items:
+            order = np.argsort(rows, kind="stable")
+            rows, columns = rows[order], columns[order]
+            starts = np.searchsorted(rows, rows, side="left")
+            keep = np.arange(len(rows)) - starts < max_user_items
+            rows, columns = rows[keep], columns[keep]
+
+        liked = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                              shape=(rows.max() + 1 if len(rows) else 0, len(ids)))
+        counts = np.asarray(liked.sum(axis=0), dtype=np.float32).ravel()
+        # Built block_size games at a time: before pruning, the rows of
+        # popular games hold most of the catalog
+        by_game = liked.T.tocsr()
+        blocks = [
+            _prune_block((by_game[start:start + block_size] @ liked).tocsr(), start, counts, top_n)
+            for start in range(0, len(ids), block_size)
+        ]
+        matrix = sp.vstack(blocks, format="csr") if blocks else sp.csr_matrix((0, 0), dtype=np.float32)
+        version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        return cls(ids, counts, matrix.astype(np.float32), version)
+
+    # Collaborative score of every game co-liked with the given ones, scaled
+    # to 1 for the best. The given games themselves are left out.
+    def score(self, game_ids: Iterable[int], weights: Iterable[float]) -> Tuple[np.ndarray, np.ndarray]:
+        game_ids = np.asarray(list(game_ids), dtype=np.int64)
+        weights = np.asarray(list(weights), dtype=np.float32)
+        with self._lock:
+            seed_counts = self._counts_of(game_ids)
+            weights = np.where(seed_counts > 0, weights / np.sqrt(np.maximum(seed_counts, 1)), 0).astype(np.float32)
+
+            positions, known = self._positions(game_ids)
+            seeds = sp.csr_matrix((weights[known], (np.zeros(known.sum(), dtype=np.intp), positions[known])),
+                                  shape=(1, len(self.ids)))
+            product = (seeds @ self.matrix).tocsr()
+            found_ids, found_scores = [self.ids[product.indices]], [product.data]
+
+            # Deltas not folded into the matrix yet
+            for deltas in (self.merging, self.pending):
+                for game_id, weight in zip(game_ids, weights):
+                    others = deltas.get(int(game_id))
+                    if others:
+                        found_ids.append(np.fromiter(others.keys(), dtype=np.int64, count=len(others)))
+                        found_scores.append(weight * np.fromiter(others.values(), dtype=np.float32, count=len(others)))
+
+            ids, inverse = np.unique(np.concatenate(found_ids), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(found_scores), minlength=len(ids))
+            scores = scores / np.sqrt(np.maximum(self._counts_of(ids), 1))
+
+        keep = (scores > 0) & ~np.isin(ids, game_ids)
+        ids, scores = ids[keep], scores[keep]
+        if len(scores):
+            scores = scores / scores.max()
+        return ids, scores.astype(np.float32)
+
+    # A user liked game_id, other_game_ids being the rest of the games they like
+    def add_interaction(self, game_id: int, other_game_ids: Iterable[int], sign: int = 1):
+        with self._lock:
+            self.pending_counts[game_id] += sign
+            for other in other_game_ids:
+                if other == game_id:
+                    continue
+                self.pending[game_id][other] += sign
+                self.pending[other][game_id] += sign
+                self.pending_pairs += 2
+
+    def remove_interaction(self, game_id: int, other_game_ids: Iterable[int]):
+        self.add_interaction(game_id, other_game_ids, sign=-1)
+
+    # Whether enough deltas piled up for a merge, and none is running
+    @property
+    def merge_due(self) -> bool:
+        return bool(self.merge_pairs) and self.pending_pairs >= self.merge_pairs and not self._merge_lock.locked()
+
+    # Folds the pending deltas into the matrix. Returns at once when another
+    # merge is running.
+    def merge(self):
+        if not self._merge_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                if not self.pending_counts and not self.pending:
+                    return
+                merging, merging_counts = self.pending, self.pending_counts
+                self.merging, self.merging_counts = merging, merging_counts
+                self.pending, self.pending_counts, self.pending_pairs = defaultdict(Counter), Counter(), 0
+                # Only merge() replaces them
+                old_ids, old_counts, old_matrix = self.ids, self.counts, self.matrix
+            try:
+                ids, counts, matrix = _fold(old_ids, old_counts, old_matrix, merging, merging_counts)
+            except Exception:
+                # Kept as deltas for the next merge
+                with self._lock:
+                    for game_id, others in merging.items():
+                        self.pending[game_id].update(others)
+                        self.pending_pairs += len(others)
+                    self.pending_counts.update(merging_counts)
+                    self.merging, self.merging_counts = {}, Counter()
+                raise
+            with self._lock:
+                self.ids, self.counts, self.matrix = ids, counts, matrix
+                self.merging, self.merging_counts = {}, Counter()
+        finally:
+            self._merge_lock.release()
+
+    def save(self, path: str):
+        # Written aside and renamed, workers never read a partial file
+        partial = path + ".partial.npz"
+        np.savez(partial, ids=self.ids, counts=self.counts, data=self.matrix.data, indices=self.matrix.indices,
+                 indptr=self.matrix.indptr, shape=np.asarray(self.matrix.shape), version=np.asarray(self.version))
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: str, merge_pairs: Optional[int] = None) -> "CooccurrenceModel":
+        with np.load(path) as data:
+            matrix = sp.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            return cls(data["ids"], data["counts"], matrix, str(data["version"]), merge_pairs)
+
+    def _positions(self, game_ids: np.ndarray):
+        positions = np.minimum(np.searchsorted(self.ids, game_ids), max(len(self.ids) - 1, 0))
+        known = self.ids[positions] == game_ids if len(self.ids) else np.zeros(len(game_ids), dtype=bool)
+        return positions, known
+
+    def _counts_of(self, game_ids: np.ndarray) -> np.ndarray:
+        positions, known = self._positions(game_ids)
+        counts = np.where(known, self.counts[positions] if len(self.ids) else 0, 0).astype(np.float32)
+        for deltas in (self.merging_counts, self.pending_counts):
+            if deltas:
+                counts += np.fromiter((deltas.get(int(game_id), 0) for game_id in game_ids),
+                                      dtype=np.float32, count=len(game_ids))
+        return counts
+
+
+# ids, counts and matrix with the deltas (game id -> co-liked game id -> count)
+# and the count deltas added
+def _fold(ids: np.ndarray, counts: np.ndarray, matrix: sp.csr_matrix, deltas: Dict[int, Counter],
+          count_deltas: Counter) -> Tuple[np.ndarray, np.ndarray, sp.csr_matrix]:
+    rows, columns, values = [], [], []
+    for game_id, others in deltas.items():
+        rows.extend([game_id] * len(others))
+        columns.extend(others.keys())
+        values.extend(others.values())
+    delta_ids = np.fromiter(count_deltas.keys(), dtype=np.int64, count=len(count_deltas))
+    merged_ids = np.union1d(ids, np.concatenate([delta_ids, np.asarray(rows, dtype=np.int64)]))
+
+    # Old positions moved to the union of the ids
+    moved = np.searchsorted(merged_ids, ids)
+    base = matrix.tocoo()
+    size = len(merged_ids)
+    delta = sp.coo_matrix(
+        (values, (np.searchsorted(merged_ids, rows), np.searchsorted(merged_ids, columns))), shape=(size, size)
+    )
+    merged = sp.coo_matrix((base.data, (moved[base.row], moved[base.col])), shape=(size, size))
+    merged = (merged.tocsr() + delta.tocsr()).astype(np.float32)
+    merged.data = np.maximum(merged.data, 0)
+    merged.eliminate_zeros()
+
+    merged_counts = np.zeros(size, dtype=np.float32)
+    merged_counts[moved] = counts
+    np.add.at(merged_counts, np.searchsorted(merged_ids, delta_ids),
+              np.fromiter(count_deltas.values(), dtype=np.float32, count=len(delta_ids)))
+    return merged_ids, np.maximum(merged_counts, 0), merged
+
+
+# Rows start to start + len(block) of the co-occurrence matrix without the
+# diagonal, each keeping its top_n entries by cosine similarity (all of them
+# when top_n is None)
+def _prune_block(block: sp.csr_matrix, start: int, counts: np.ndarray, top_n: Optional[int]) -> sp.csr_matrix:
+    rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+    keep = block.indices != rows + start
+    if top_n:
+        similarity = block.data / np.sqrt(counts[rows + start] * counts[block.indices])
+        similarity[~keep] = -np.inf
+        order = np.lexsort((-similarity, rows))
+        rank = np.arange(len(order)) - block.indptr[rows[order]]
+        top = np.zeros(len(keep), dtype=bool)
+        top[order[rank < top_n]] = True
+        keep &= top
+    return sp.csr_matrix((block.data[keep], (rows[keep], block.indices[keep])), shape=block.shape, dtype=np.float32)
@@ -1,20 +1,31 @@
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 import asyncio
 from sqlalchemy.exc import OperationalError
-from sqlalchemy import func, desc
-from time import sleep
+from sqlalchemy import func, desc, literal, literal_column, union_all
+from time import sleep, perf_counter
 from . import models
-from .schemas import UserDetails, UserSimple ,UserCreate, UserFollower, UserNicknameUsernameReviews, FollowerDetails, ReviewRead, UserUpdate, GamePrediction, ReviewCreate, GamePredictionTrain, ReviewUpdate, GameRead
+from .schemas import UserDetails, UserSimple ,UserCreate, UserFollower, UserNicknameUsernameReviews, FollowerDetails, ReviewRead, UserUpdate, ReviewCreate, ReviewUpdate, GameRead, GameSeed, GameSuggestion, GameBrowse, GameSearchPage
 import numpy as np
-from typing import List
-from . import utils
-import faiss
+from collections import Counter
+from typing import List, Optional
+from .encoder import game_encoder
+from .faiss_index import index_manager, LoadedIndex, drop_self
+from .cache import recommendation_cache, search_cache
+from .config import settings
+from .profile import build_query_vectors, neighbours_per_query
+from .collaborative import collaborative_manager, LIKED_RATING
+from .cooccurrence import CooccurrenceModel
+from .popular import popular_games
+from .title_index import title_index
+from .autocomplete import title_autocomplete
+from .catalog import catalog_watcher
+from .facets import facet_index
 
 # Get one game by id
-def get_game(db: Session, game_id: int):
-    return db.query(models.Game).filter(models.Game.id == game_id).first()
+async def get_game(db: AsyncSession, game_id: int):
+    return await db.get(models.Game, game_id)
 
 # def create_game(db: Session, game:schemas.GameCreate):
 #     db_game = models.Game(title = game.tittle, genre = game.genre, url = game.url, release_date = game.release_date, 
@@ -27,38 +38,34 @@ def get_game(db: Session, game_id: int):
 #     return db_game
 
 # Get one game by title
-def get_game_by_title_exact(db: Session, title: str):
-    return db.query(models.Game).filter(models.Game.title == title).first()
+async def get_game_by_title_exact(db: AsyncSession, title: str):
+    result = await db.execute(select(models.Game).filter(models.Game.title == title).limit(1))
+    return result.scalars().first()
 
 
+# Served from search_cache when the same words were searched before, in any
+# order: neither the matches nor their distances depend on it
 async def get_games_by_similar_title(db: AsyncSession, title: str, max_distance: int = 40, limit: int = 10):
-    search_words = title.strip().lower().split()
-
-    stmt = select(models.Game)
-
-    # Filter by keyword presence using ILIKE
-    for word in search_words:
-        stmt = stmt.filter(models.Game.title.ilike(f"%{word}%"))
-
-    # Calculate Levenshtein distance for each word and sum them
-    levenshtein_sum = sum(
-        func.levenshtein(func.lower(models.Game.title), word) for word in search_words
-    )
-
-    # Add the sum as a column to the query
-    stmt = stmt.add_columns(
-        levenshtein_sum.label('total_levenshtein_distance')
-    ).group_by(models.Game.id)
-
-    # Apply having clause to filter games based on cumulative Levenshtein distance
-    stmt = stmt.having(levenshtein_sum <= max_distance * len(search_words))
-
-    # Order by the cumulative Levenshtein distance
-    stmt = stmt.order_by('total_levenshtein_distance').limit(limit)
-
-    # Execute the query asynchronously
-    result = await db.execute(stmt)
-    games_with_distances = result.all()
+    key = (tuple(sorted(title.strip().lower().split())), max_distance, limit)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+    started = perf_counter()
+    games = [GameRead(**game.__dict__) for game in await search_games_by_similar_title(db, title, max_distance, limit)]
+    search_cache.set(key, games, cost=perf_counter() - started)
+    return games
+
+
+async def search_games_by_similar_title(db: AsyncSession, title: str, max_distance: int = 40, limit: int = 10):
+    if settings.title_search_index and title_index.ready:
+        # Same matches and distances as the query below, without the scan
+        matches = title_index.search(title, max_distance, limit)
+        result = await db.execute(select(models.Game).where(models.Game.id.in_([game_id for game_id, _ in matches])))
+        games = {game.id: game for game in result.scalars().all()}
+        # Games deleted since the index was built are skipped
+        games_with_distances = [(games[game_id], distance) for game_id, distance in matches if game_id in games]
+    else:
+        games_with_distances = await scan_games_by_similar_title(db, title, max_distance, limit)
 
     # Calculate developer frequency
     developer_frequency = {}
@@ -79,72 +86,165 @@ async def get_games_by_similar_title(db: AsyncSession, title: str, max_distance:
     return [game_tuple[0] for game_tuple in sorted_games]
 
 
-async def get_games_prediction(db: AsyncSession, title: str, max_distance: int = 40, limit: int = 12):
-    search_words = title.strip().lower().split()
-    
-    #Eliminamos números solos
-    for word in search_words:
-        if word.isdigit():
-            search_words.remove(word)
-
-    # Parte 1: Encontrar títulos de juegos similares
-    stmt = select(models.Game.title)
+# Titles starting a word with prefix, most popular first. None until the
+# suggestions are built.
+def get_title_suggestions(prefix: str, limit: int = 10) -> Optional[List[GameSuggestion]]:
+    if not title_autocomplete.ready:
+        return None
+    return [GameSuggestion(id=game_id, title=title) for game_id, title in title_autocomplete.suggest(prefix, limit)]
+
+
+# Text search configuration of games.search_vector
+FULL_TEXT_CONFIG = "english"
+
+
+# Full-text search over title, developer and publisher through the indexed
+# games.search_vector, ranked (title words above developer above publisher)
+# and paged by the database. websearch_to_tsquery takes what users type:
+# "quoted phrases", or, -excluded words.
+async def search_games_full_text(db: AsyncSession, query: str, offset: int = 0, limit: int = 20) -> GameSearchPage:
+    tsquery = func.websearch_to_tsquery(literal_column(f"'{FULL_TEXT_CONFIG}'"), query)
+    matches = models.Game.search_vector.op("@@")(tsquery)
+    # Normalization 1 divides the rank by the log of the document length: a
+    # query that is a whole title ranks that title above the longer ones
+    # containing it
+    stmt = (
+        select(models.Game, func.count().over().label("total"))
+        .where(matches)
+        .order_by(func.ts_rank_cd(models.Game.search_vector, tsquery, 1).desc(), models.Game.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    rows = (await db.execute(stmt)).all()
+    if rows:
+        total = rows[0].total
+    elif offset:
+        # Past the last page, the rows carry no total
+        total = (await db.execute(select(func.count()).select_from(models.Game).where(matches))).scalar()
+    else:
+        total = 0
+    return GameSearchPage(total=total, games=[GameRead(**row.Game.__dict__) for row in rows])
 
-    for word in search_words:
-        stmt = stmt.filter(models.Game.title.ilike(f"%{word}%"))
 
-    levenshtein_sum = sum(
-        func.levenshtein(func.lower(models.Game.title), word) for word in search_words
+# Games matching every facet of filters (facet: accepted values), best rated
+# first. None until the facets are built, ValueError on unknown values.
+async def browse_games(db: AsyncSession, filters: dict, offset: int = 0, limit: int = 20) -> Optional[GameBrowse]:
+    if not facet_index.ready:
+        return None
+    game_ids, total, facets = facet_index.search(filters, offset, limit)
+    result = await db.execute(select(models.Game).where(models.Game.id.in_(game_ids)))
+    games = {game.id: game for game in result.scalars().all()}
+    return GameBrowse(
+        total=total,
+        games=[GameRead(**games[game_id].__dict__) for game_id in game_ids if game_id in games],
+        facets=facets,
     )
 
+
+# Games whose title contains every word of title, closest first, with their
+# summed Levenshtein distance
+async def scan_games_by_similar_title(db: AsyncSession, title: str, max_distance: int = 40, limit: int = 10):
+    search_words = title.strip().lower().split()
+
+    stmt = select(models.Game)
+
+    # Filter by keyword presence, and sum the Levenshtein distance of each word
+    word_filters, levenshtein_sum = title_match(search_words)
+    stmt = stmt.filter(*word_filters)
+
+    # Add the sum as a column to the query
     stmt = stmt.add_columns(
         levenshtein_sum.label('total_levenshtein_distance')
-    ).group_by(models.Game.title)
+    ).group_by(models.Game.id)
 
+    # Apply having clause to filter games based on cumulative Levenshtein distance
     stmt = stmt.having(levenshtein_sum <= max_distance * len(search_words))
+
+    # Order by the cumulative Levenshtein distance
     stmt = stmt.order_by('total_levenshtein_distance').limit(limit)
 
+    # Execute the query asynchronously
     result = await db.execute(stmt)
-    titles = result.scalars().all()
-
-    # Parte 2: Obtener detalles de estos juegos
-    games_details_stmt = select(
-        models.Game.title,
-        models.Game.primary_genre,
-        models.Game.genres,
-        models.Game.steam_rating,
-        models.Game.platform_rating,
-        models.Game.publisher,
-        models.Game.detected_technologies,
-        models.Game.developer,
-        models.Award.name.label('award_names')
-    ).outerjoin(models.Game_awards, models.Game.id == models.Game_awards.game_id
-    ).outerjoin(models.Award, models.Game_awards.award_id == models.Award.id
-    ).where(models.Game.title.in_(titles))
-
-    detail_result = await db.execute(games_details_stmt)
-    detail_rows = detail_result.all()
+    return result.all()
 
-    games_temp = {}
-    for row in detail_rows:
-        if row.title not in games_temp:
-            games_temp[row.title] = {
-                'title': row.title,
-                'primary_genre': row.primary_genre,
-                'genres': row.genres,
-                'steam_rating': row.steam_rating,
-                'platform_rating': row.platform_rating,
-                'publisher': row.publisher,
-                'detected_technologies': row.detected_technologies,
-                'developer': row.developer,
-                'award_names': set()
-            }
-        if row.award_names:
-            games_temp[row.title]['award_names'].add(row.award_names)
 
-    games_predictions = [GamePrediction(**game) for game in games_temp.values()]
+# Lowercase words of a title, without standalone numbers
+def title_search_words(title: str):
+    #Eliminamos números solos
+    return [word for word in title.strip().lower().split() if not word.isdigit()]
+
+
+# Filters keeping the games whose title contains every word, and the summed
+# Levenshtein distance between the lowercase title and the words.
+# With title_search_trgm the words are matched against lower(title), which the
+# pg_trgm GIN index of migrations/003_games_title_trgm.sql serves, instead of
+# an ILIKE on title that reads every row. The title then contains each word,
+# so levenshtein(lower(title), word) is len(title) - len(word) and the sum is
+# computed from the length, not per row with levenshtein.
+# Words under three characters have no trigram, the index cannot serve them:
+# they are checked with strpos on the rows the longer words found, so they
+# never turn into a scan of the whole index. A query of short words only
+# reads the table (benchmarks/bench_title_trgm.py measures it).
+def title_match(search_words: List[str]):
+    if settings.title_search_trgm:
+        lower_title = func.lower(models.Game.title)
+        word_filters = [
+            lower_title.like(f"%{word}%") if len(word) >= 3 else func.strpos(lower_title, word) > 0
+            for word in search_words
+        ]
+        levenshtein_sum = len(search_words) * func.char_length(models.Game.title) - sum(map(len, search_words))
+        return word_filters, levenshtein_sum
+    word_filters = [models.Game.title.ilike(f"%{word}%") for word in search_words]
+    levenshtein_sum = sum(
+        func.levenshtein(func.lower(models.Game.title), word) for word in search_words
+    )
+    return word_filters, levenshtein_sum
+
+
+# Similar titles for many seed titles at once, then one query for the details
+# of every match. Returns (seed position, game row) pairs, best matches of
+# each seed first. Resolved from the title index when it is built, otherwise
+# with one statement holding a Levenshtein branch per title.
+async def get_games_similar_to_titles(db: AsyncSession, titles: List[str], max_distance: int = 40, limit: int = 9):
+    if settings.title_search_index and title_index.ready:
+        matches = [
+            (position, game_id, distance)
+            for position, title in enumerate(titles)
+            for game_id, distance in title_index.search_titles(" ".join(title_search_words(title)), max_distance, limit)
+        ]
+    else:
+        matches = await scan_games_similar_to_titles(db, titles, max_distance, limit)
+    if not matches:
+        return []
+    matches.sort(key=lambda match: (match[0], match[2]))
+
+    details = await db.execute(games_with_awards_query().where(models.Game.id.in_({game_id for _, game_id, _ in matches})))
+    games = {row.id: row for row in details.all()}
+    return [(seed, games[game_id]) for seed, game_id, _ in matches if game_id in games]
+
+
+# (seed position, game id, distance) of the matches of every title, by SQL
+async def scan_games_similar_to_titles(db: AsyncSession, titles: List[str], max_distance: int, limit: int):
+    branches = []
+    for position, title in enumerate(titles):
+        search_words = title_search_words(title)
+        if not search_words:
+            continue
+        word_filters, levenshtein_sum = title_match(search_words)
+        # One game per distinct title, the lowest id
+        branches.append(
+            select(literal(position).label('seed'), func.min(models.Game.id).label('id'), levenshtein_sum.label('distance'))
+            .where(*word_filters)
+            .group_by(models.Game.title)
+            .having(levenshtein_sum <= max_distance * len(search_words))
+            .order_by(levenshtein_sum, models.Game.title)
+            .limit(limit)
+        )
+    if not branches:
+        return []
 
-    return games_predictions
+    result = await db.execute(union_all(*branches))
+    return [(match.seed, match.id, match.distance) for match in result.all()]
 
 
 # Users
@@ -153,7 +253,6 @@ async def get_user_no_password(db: AsyncSession, nickname: str):
     query = select(models.User).where(models.User.nickname == nickname)
     result = await db.execute(query)
     user = result.scalars().first()
-    print(user)
     return user
 
 
@@ -218,27 +317,27 @@ async def get_all_users(db: AsyncSession):
 
 
 # Get followers and following with details 
-def get_user_followers_and_following(db: Session, user_nickname: str) -> FollowerDetails:
+async def get_user_followers_and_following(db: AsyncSession, user_nickname: str) -> FollowerDetails:
 
-    followers_query = db.query(
+    followers_result = await db.execute(select(
         models.User_followers.user_follower_nickname, 
         models.User.nickname, 
         models.User.username,
         models.Review.game_id
     ).join(models.User, models.User.nickname == models.User_followers.user_follower_nickname)\
     .outerjoin(models.Review, models.User_followers.user_follower_nickname == models.Review.user_nickname)\
-    .filter(models.User_followers.user_following_nickname == user_nickname)\
-    .all()
+    .filter(models.User_followers.user_following_nickname == user_nickname))
+    followers_query = followers_result.all()
 
-    following_query = db.query(
+    following_result = await db.execute(select(
         models.User_followers.user_following_nickname, 
         models.User.nickname, 
         models.User.username,
         models.Review.game_id
     ).join(models.User, models.User.nickname == models.User_followers.user_following_nickname)\
     .outerjoin(models.Review, models.User_followers.user_following_nickname == models.Review.user_nickname)\
-    .filter(models.User_followers.user_follower_nickname == user_nickname)\
-    .all()
+    .filter(models.User_followers.user_follower_nickname == user_nickname))
+    following_query = following_result.all()
     
     followers = {}
     following = {}
@@ -269,18 +368,25 @@ def get_user_followers_and_following(db: Session, user_nickname: str) -> Followe
     return FollowerDetails(followers=followers_list, following=following_list)
     
     
+# bcrypt takes tens of milliseconds of CPU, it runs in the default executor
+# instead of blocking the event loop
+async def verify_user_password(user: models.User, password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(None, user.verify_password, password)
+
+
 # Add user to database
-def add_user(db: Session, user: UserCreate):
+async def add_user(db: AsyncSession, user: UserCreate):
     db_user = models.User(nickname=user.nickname, email=user.email, password=user.password, genre=user.genre, about_me=user.about_me, birthdate=user.birthdate, username=user.username)
-    db_user.hash_password(user.password)
+    await asyncio.get_running_loop().run_in_executor(None, db_user.hash_password, user.password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user.nickname
 
 
-def update_user_data(db: Session, user_nickname: str, user: UserUpdate):
-    existing_user = db.query(models.User).filter(models.User.nickname == user_nickname).first()
+async def update_user_data(db: AsyncSession, user_nickname: str, user: UserUpdate):
+    result = await db.execute(select(models.User).filter(models.User.nickname == user_nickname))
+    existing_user = result.scalars().first()
 
     if not existing_user:
         return None
@@ -296,18 +402,18 @@ def update_user_data(db: Session, user_nickname: str, user: UserUpdate):
     if user.username is not None:
         existing_user.username = user.username
 
-    db.commit()
-    db.refresh(existing_user) 
+    await db.commit()
+    await db.refresh(existing_user) 
 
     return existing_user
 
 
 # Followers
-def add_follower(db: Session, followerData: UserFollower):
+async def add_follower(db: AsyncSession, followerData: UserFollower):
     db_follower = models.User_followers(user_follower_nickname=followerData.user_follower_nickname, user_following_nickname=followerData.user_following_nickname)
     db.add(db_follower)
-    db.commit()
-    db.refresh(db_follower)
+    await db.commit()
+    await db.refresh(db_follower)
     return db_follower
 
 
@@ -338,6 +444,8 @@ async def add_review_by_nickname(db: AsyncSession, review: ReviewCreate, user_ni
     db.add(db_review)
     await db.commit()
     await db.refresh(db_review)
+    invalidate_user_recommendations(user_nickname)
+    await update_collaborative_model(db, None, (user_nickname, db_review.game_id, db_review.rating))
     return db_review
 
 
@@ -356,13 +464,16 @@ async def get_user_review(db: AsyncSession, user_nickname: str, game_id: int):
 
 
 async def delete_review(db: AsyncSession, user_nickname: str, game_id: int):
-    query = select(models.Review).filter(models.Review.user_nickname == user_nickname).filter(models.Game.id == game_id)
+    query = select(models.Review).filter(models.Review.user_nickname == user_nickname).filter(models.Review.game_id == game_id)
     result = await db.execute(query)
     review = result.scalars().first()
 
     if review:
+        before = (review.user_nickname, review.game_id, review.rating)
         await db.delete(review)
         await db.commit()
+        invalidate_user_recommendations(user_nickname)
+        await update_collaborative_model(db, before, None)
         return True
     else:
         return False
@@ -373,6 +484,7 @@ async def update_review(db: AsyncSession, user_nickname: str, review_id: int, re
 
     if not existing_review:
         return None
+    before = (existing_review.user_nickname, existing_review.game_id, existing_review.rating)
 
     if review.game_id is not None:
         existing_review.game_id = review.game_id
@@ -388,57 +500,104 @@ async def update_review(db: AsyncSession, user_nickname: str, review_id: int, re
     await db.commit()
     await db.refresh(existing_review) 
 
-    return existing_review
+    # The review may have moved to another user
+    invalidate_user_recommendations(user_nickname)
+    invalidate_user_recommendations(existing_review.user_nickname)
+    await update_collaborative_model(
+        db, before, (existing_review.user_nickname, existing_review.game_id, existing_review.rating)
+    )
 
+    return existing_review
 
-#tests
-async def get_all_games_as_predictions(db: AsyncSession):
-    GameAlias = aliased(models.Game)
-    AwardsAlias = aliased(models.Award)
 
-    # Consulta para seleccionar todos los juegos y sus premios asociados
-    query = (
+# Games liked by a user, with how many of their liking review and wishlist
+# entry mark it
+async def get_user_liked_game_counts(db: AsyncSession, user_nickname: str) -> Counter:
+    reviews = select(models.Review.game_id).where(
+        models.Review.user_nickname == user_nickname, models.Review.rating > LIKED_RATING
+    )
+    wishlist = select(models.Users_wishlist.game_id).where(models.Users_wishlist.user_nickname == user_nickname)
+    result = await db.execute(union_all(reviews, wishlist))
+    return Counter(result.scalars().all())
+
+
+# Applies a review write to the collaborative model of this worker. before
+# and after are (user nickname, game id, rating), None when the review did
+# not exist before or was deleted. The model counts a (user, game) pair
+# once, as its build does: a review of a game that stays liked through the
+# wishlist adds or removes nothing.
+async def update_collaborative_model(db: AsyncSession, before, after):
+    model = collaborative_manager.get()
+    if model is None:
+        return
+    liked_before = before if before is not None and before[2] > LIKED_RATING else None
+    liked_after = after if after is not None and after[2] > LIKED_RATING else None
+    if liked_before is not None and liked_after is not None and liked_before[:2] == liked_after[:2]:
+        return
+    # Read after the write
+    if liked_before is not None:
+        user_nickname, game_id, _ = liked_before
+        liked = await get_user_liked_game_counts(db, user_nickname)
+        if game_id not in liked:
+            model.remove_interaction(game_id, liked)
+    if liked_after is not None:
+        user_nickname, game_id, _ = liked_after
+        liked = await get_user_liked_game_counts(db, user_nickname)
+        if liked[game_id] < 2:
+            model.add_interaction(game_id, liked)
+    collaborative_manager.merge_if_due(model)
+
+
+# Games with their award names, one row per game
+def games_with_awards_query():
+    return (
         select(
-            GameAlias.id,
-            GameAlias.title,
-            GameAlias.primary_genre,
-            GameAlias.genres,
-            GameAlias.steam_rating,
-            GameAlias.platform_rating,
-            GameAlias.publisher,
-            GameAlias.detected_technologies,
-            GameAlias.developer,
-            AwardsAlias.name.label('award_names')
+            models.Game.id,
+            models.Game.title,
+            models.Game.primary_genre,
+            models.Game.genres,
+            models.Game.steam_rating,
+            models.Game.platform_rating,
+            models.Game.publisher,
+            models.Game.detected_technologies,
+            models.Game.developer,
+            models.Game.feature_bits,
+            func.array_remove(func.array_agg(models.Award.name), None).label('award_names')
         )
-        .outerjoin(models.Game_awards, GameAlias.id == models.Game_awards.game_id)  # Unir Game_awards con Game
-        .outerjoin(AwardsAlias, models.Game_awards.award_id == AwardsAlias.id)  # Unir Awards con Game_awards
-        .group_by(GameAlias.id, GameAlias.title, AwardsAlias.name)
+        .outerjoin(models.Game_awards, models.Game.id == models.Game_awards.game_id)
+        .outerjoin(models.Award, models.Game_awards.award_id == models.Award.id)
+        .group_by(models.Game.id)
     )
 
-    result = await db.execute(query)
-    rows = result.all()
 
-    games_temp = {}
-    for row in rows:
-        if row.title not in games_temp:
-            games_temp[row.title] = {
-                'id': row.id, 
-                'title': row.title,
-                'primary_genre': row.primary_genre,
-                'genres': row.genres,
-                'steam_rating': row.steam_rating,
-                'platform_rating': row.platform_rating,
-                'publisher': row.publisher,
-                'detected_technologies': row.detected_technologies,
-                'developer': row.developer,
-                'award_names': set()
-            }
-        if row.award_names:
-            games_temp[row.title]['award_names'].add(row.award_names)
+# Random sample of the catalog used to train the IVF quantizer
+async def get_games_training_sample(db: AsyncSession, sample_size: int):
+    result = await db.execute(games_with_awards_query().order_by(func.random()).limit(sample_size))
+    return result.all()
 
-    games_predictions = [GamePredictionTrain(**game) for game in games_temp.values()]
 
-    return games_predictions
+# Whole catalog through a server-side cursor, chunk_size games at a time
+async def stream_games_with_awards(db: AsyncSession, chunk_size: int):
+    query = games_with_awards_query().order_by(models.Game.id).execution_options(yield_per=chunk_size)
+    result = await db.stream(query)
+    async for rows in result.partitions(chunk_size):
+        yield rows
+
+
+async def get_database_now(db: AsyncSession):
+    result = await db.execute(select(func.now()))
+    return result.scalar_one()
+
+
+# Games added or modified after the given database timestamp
+async def get_games_changed_since(db: AsyncSession, since):
+    result = await db.execute(games_with_awards_query().where(models.Game.updated_at > since))
+    return result.all()
+
+
+async def get_all_game_ids(db: AsyncSession):
+    result = await db.execute(select(models.Game.id))
+    return np.array(result.scalars().all(), dtype=np.int64)
 
 
 async def get_user_reviews_games(db: AsyncSession, user_nickname: str):
@@ -448,6 +607,7 @@ async def get_user_reviews_games(db: AsyncSession, user_nickname: str):
 
     query = (
         select(
+            GameAlias.id,
             GameAlias.title,
             GameAlias.primary_genre,
             GameAlias.genres,
@@ -456,13 +616,15 @@ async def get_user_reviews_games(db: AsyncSession, user_nickname: str):
             GameAlias.publisher,
             GameAlias.detected_technologies,
             GameAlias.developer,
-            AwardsAlias.name.label('award_names')
+            GameAlias.feature_bits,
+            AwardsAlias.name.label('award_names'),
+            models.Review.rating
         )
         .join(models.Review, models.Review.game_id == GameAlias.id)  # Unir Review con Game
         .outerjoin(models.Game_awards, GameAlias.id == models.Game_awards.game_id)  # Unir Game_awards con Game
         .outerjoin(AwardsAlias, models.Game_awards.award_id == AwardsAlias.id)  # Unir Awards con Game_awards
         .filter(models.Review.user_nickname == user_nickname)  # Filtro para las reseñas del usuario
-        .filter(models.Review.rating > 7)  # Filtrar reseñas con calificación alta
+        .filter(models.Review.rating > LIKED_RATING)  # Filtrar reseñas con calificación alta
     )
         
     result = await db.execute(query)
@@ -472,6 +634,7 @@ async def get_user_reviews_games(db: AsyncSession, user_nickname: str):
     for row in rows:
         if row.title not in games_temp:
             games_temp[row.title] = {
+                'id': row.id,
                 'title': row.title,
                 'primary_genre': row.primary_genre,
                 'genres': row.genres,
@@ -480,13 +643,15 @@ async def get_user_reviews_games(db: AsyncSession, user_nickname: str):
                 'publisher': row.publisher,
                 'detected_technologies': row.detected_technologies,
                 'developer': row.developer,
-                'award_names': set() if row.award_names else set()
+                'feature_bits': row.feature_bits,
+                'award_names': set() if row.award_names else set(),
+                'weight': float(row.rating)
             }
         if row.award_names:
             games_temp[row.title]['award_names'].add(row.award_names)
 
 
-    games_predictions = [GamePrediction(**game) for game in games_temp.values()]
+    games_predictions = [GameSeed(**game) for game in games_temp.values()]
     
     return games_predictions
 
@@ -498,6 +663,7 @@ async def get_user_whishlist_games(db: AsyncSession, user_nickname: str):
     
         query = (
             select(
+                GameAlias.id,
                 GameAlias.title,
                 GameAlias.primary_genre,
                 GameAlias.genres,
@@ -506,6 +672,7 @@ async def get_user_whishlist_games(db: AsyncSession, user_nickname: str):
                 GameAlias.publisher,
                 GameAlias.detected_technologies,
                 GameAlias.developer,
+                GameAlias.feature_bits,
                 AwardsAlias.name.label('award_names')
             )
             .join(models.Users_wishlist, models.Users_wishlist.game_id == GameAlias.id)  # Unir Users_wishlist con Game
@@ -521,6 +688,7 @@ async def get_user_whishlist_games(db: AsyncSession, user_nickname: str):
         for row in rows:
             if row.title not in games_temp:
                 games_temp[row.title] = {
+                    'id': row.id,
                     'title': row.title,
                     'primary_genre': row.primary_genre,
                     'genres': row.genres,
@@ -529,153 +697,280 @@ async def get_user_whishlist_games(db: AsyncSession, user_nickname: str):
                     'publisher': row.publisher,
                     'detected_technologies': row.detected_technologies,
                     'developer': row.developer,
-                    'award_names': set() if row.award_names else set()
+                    'feature_bits': row.feature_bits,
+                    'award_names': set() if row.award_names else set(),
+                    'weight': settings.profile_wishlist_weight
                 }
             if row.award_names:
                 games_temp[row.title]['award_names'].add(row.award_names)
     
     
-        games_predictions = [GamePrediction(**game) for game in games_temp.values()]
+        games_predictions = [GameSeed(**game) for game in games_temp.values()]
         
         return games_predictions
 
 
-def create_numpy_array_for_game(game: GamePrediction, genres_mapping, game_engines_mapping, award_categories_mapping):
-    #In the future it will be used our rating
-    rating = float(game.steam_rating) * 0.008
-    rating = rating 
-    
-    genres_array = np.zeros(len(genres_mapping))
-    for genre in game.genres.split(','):
-        if genre in genres_mapping:
-            genres_array[genres_mapping[genre]] = 1
-            
-    primary_genres_array = np.zeros(len(genres_mapping))
-    if game.primary_genre in genres_mapping:
-        primary_genres_array[genres_mapping[game.primary_genre]] = 0.1
-            
-    game_engines_array = np.zeros(len(game_engines_mapping))
-    for engine in game.detected_technologies:
-        if engine in game_engines_mapping:
-            game_engines_array[game_engines_mapping[engine]] = 1
-
-    award_categories_array = np.zeros(len(award_categories_mapping))
-    for award in game.award_names:
-        if award in award_categories_mapping:
-            award_categories_array[award_categories_mapping[award]] = 1
-
-    # Concatenar todos los arrays en un único array unidimensional
-    game_array = np.concatenate([
-        [rating], 
-        primary_genres_array, 
-        genres_array, 
-        game_engines_array, 
-        award_categories_array
-    ])
-    
-    return game_array
+# A user's seed games: reviews rated above LIKED_RATING and wishlist entries
+async def load_seed_games(db: AsyncSession, user_nickname: str):
+    reviews = await get_user_reviews_games(db, user_nickname)
+    wishlist = await get_user_whishlist_games(db, user_nickname)
+    return reviews, wishlist
 
 
-async def create_numpy_arrays(db: AsyncSession, user_nickname: str):
-    games1 = await get_user_reviews_games(db, user_nickname)
-    games2 = await get_user_whishlist_games(db, user_nickname)
-
-    all_games = []
-    all_games.extend(games1)
-    all_games.extend(games2)
-
-   
-    for game in games1:
-        similar_games = await get_games_prediction(db, game.title, 40, 9)
-        for similar_game in similar_games:
-            if similar_game not in all_games:  # Evitar duplicados
-                all_games.append(similar_game)
-                
-    #for game in games2:
-    #    similar_games = await get_games_prediction(db, game.title, 40, 4)
-    
-    # Mapping
-    genres = utils.genres
-    genres_mapping = {genre: index for index, genre in enumerate(genres)}
-    
-    game_engines = utils.game_engines
-    game_engines_mapping = {engine: index for index, engine in enumerate(game_engines)}
-    
-    award_categories = utils.award_categories
-    award_categories_mapping = {category: index for index, category in enumerate(award_categories)}
-    
-    
-    numpy_arrays = [create_numpy_array_for_game(game, genres_mapping, game_engines_mapping, award_categories_mapping).flatten() for game in all_games]
+# Similar titles of the best rated reviews, found in one batched step, as
+# (game, weight) pairs
+async def expand_seed_games(db: AsyncSession, reviews: List[GameSeed]):
+    expanded = sorted(reviews, key=lambda game: game.weight, reverse=True)[:settings.similar_titles_max_seeds]
+    similar_games = await get_games_similar_to_titles(db, [game.title for game in expanded], 40, 9)
+    # A similar title says less about the user than the game it was found from
+    return [(similar_game, expanded[seed].weight * settings.profile_similar_weight) for seed, similar_game in similar_games]
 
-    # Concatenar todos los arrays en un único array bidimensional
-    if numpy_arrays:
-        combined_array = np.vstack(numpy_arrays)
-    else:
-        combined_array = np.array([])
-        
-    vectors = np.array(combined_array).astype('float32')
-    
-    return vectors
 
+# Seeds and candidates by game id, with their weight
+def seed_arrays(seeds: List[GameSeed], similar_games):
+    all_games = {}
+    for game in seeds:
+        if game.id not in all_games:
+            all_games[game.id] = (game, game.weight)
+    for similar_game, weight in similar_games:
+        if similar_game.id not in all_games or all_games[similar_game.id][1] < weight:
+            all_games[similar_game.id] = (similar_game, weight)
 
-async def get_games_predictions(db: AsyncSession, user_nickname: str, k: int = 10):
-    vectors = await create_numpy_arrays(db, user_nickname)
-    index = faiss.read_index("games.index")
-    index.nprobe = 100  # Ajusta esto según la necesidad de equilibrio entre velocidad y precisión
+    ids = np.fromiter(all_games, dtype=np.int64, count=len(all_games))
+    vectors = game_encoder.encode([game for game, _ in all_games.values()])
+    weights = np.fromiter((weight for _, weight in all_games.values()), dtype=np.float32, count=len(all_games))
+    return ids, vectors, weights
 
-    all_game_ids = set()
 
-    for v in vectors:
-        _, indexes = index.search(np.expand_dims(v, axis=0), k)
-        game_ids = [await get_games_id_from_faiss(db, idx) for idx in indexes[0]]
-        all_game_ids.update(game_ids)
+async def create_numpy_arrays(db: AsyncSession, user_nickname: str):
+    reviews, wishlist = await load_seed_games(db, user_nickname)
+    similar_games = await expand_seed_games(db, reviews)
+    return seed_arrays(reviews + wishlist, similar_games)
+
 
+# Returns (games, partial), see compute_games_predictions
+async def get_games_predictions(db: AsyncSession, user_nickname: str, k: int = 10):
+    loaded = index_manager.get()
+    model = collaborative_manager.get()
+    # Entries stored by a request that raced an index or model swap carry the
+    # old versions
+    version = (loaded.version, model.version if model is not None else None)
+    cached = recommendation_cache.get((user_nickname, k))
+    if cached is not None and cached[0] == version:
+        return cached[1], False
+
+    generation = recommendation_generations[user_nickname]
+    games, partial = await compute_games_predictions(db, loaded, user_nickname, k, model)
+    # Partial results are not kept, the next request tries again. Neither are
+    # results that may have read the seeds from before a write.
+    if not partial and recommendation_generations[user_nickname] == generation:
+        recommendation_cache.set((user_nickname, k), (version, games))
+    return games, partial
+
+
+# Candidates come from the FAISS neighbours of the seeds, scored by rank, and
+# from the collaborative model; both scores are blended with
+# collaborative_weight. Best blended score first.
+#
+# Every stage runs within its prediction_*_budget. When loading the seeds,
+# searching or hydrating runs out of time, the response is made of the
+# popular games of the seeds' genres instead; when the similar titles
+# expansion does, the prediction goes on with the seeds alone. Returns
+# (games, partial), partial telling that a stage was cut short.
+async def compute_games_predictions(db: AsyncSession, loaded: LoadedIndex, user_nickname: str, k: int,
+                                    model: Optional[CooccurrenceModel] = None):
+    try:
+        reviews, wishlist = await within_budget(db, settings.prediction_seeds_budget, load_seed_games(db, user_nickname))
+    except asyncio.TimeoutError:
+        return popular_games.fill(Counter(), (), k), True
+    seeds = reviews + wishlist
+    genres = Counter()
+    for game in seeds:
+        genres[game.primary_genre] += game.weight
+
+    partial = False
+    try:
+        similar_games = await within_budget(db, settings.prediction_expansion_budget, expand_seed_games(db, reviews))
+    except asyncio.TimeoutError:
+        similar_games, partial = [], True
+
+    ids, vectors, weights = seed_arrays(seeds, similar_games)
+    if len(vectors) == 0:
+        return [], partial
+
+    try:
+        game_ids, scores = await within_budget(
+            db, settings.prediction_search_budget, search_candidates(db, loaded, ids, vectors, weights, k, model)
+        )
+        games = await within_budget(db, settings.prediction_hydration_budget, hydrate_candidates(db, game_ids, scores))
+    except asyncio.TimeoutError:
+        return popular_games.fill(genres, ids.tolist(), k), True
+    return games, partial
+
+
+# Awaits one stage of a prediction for at most budget seconds, 0 waits as long
+# as it takes. A query cancelled on the way leaves the session to roll back.
+async def within_budget(db: AsyncSession, budget: float, stage):
+    if budget <= 0:
+        return await stage
+    try:
+        return await asyncio.wait_for(stage, budget)
+    except asyncio.TimeoutError:
+        await db.rollback()
+        raise
+
+
+# Candidate game ids and their blended scores. FAISS and the collaborative
+# model run in the default executor, off the event loop, so a stage budget
+# can expire while they run.
+async def search_candidates(db: AsyncSession, loaded: LoadedIndex, ids: np.ndarray, vectors: np.ndarray,
+                            weights: np.ndarray, k: int, model: Optional[CooccurrenceModel] = None):
+    loop = asyncio.get_running_loop()
+    seed_ids, seed_weights = ids, weights
+
+    # Seeds with precomputed neighbours are plain lookups
+    content = []
+    table = index_manager.neighbors(loaded)
+    if table is not None and k <= table.shape[1]:
+        positions, known = loaded.positions(ids)
+        content.append(rank_scores(table[positions[known], :k]))
+        vectors, weights = vectors[~known], weights[~known]
+
+    if len(vectors):
+        labels = await loop.run_in_executor(None, search_profile, loaded, vectors, weights, k)
+        content.append(rank_scores(await map_faiss_labels(db, loaded, labels)))
+
+    # Best score of each game over every seed and taste vector
+    game_ids, inverse = np.unique(np.concatenate([found for found, _ in content]), return_inverse=True)
+    scores = np.zeros(len(game_ids), dtype=np.float32)
+    np.maximum.at(scores, inverse, np.concatenate([found_scores for _, found_scores in content]))
+
+    if model is not None and settings.collaborative_weight > 0:
+        collaborative_ids, collaborative_scores = await loop.run_in_executor(None, model.score, seed_ids, seed_weights)
+        best = np.argsort(-collaborative_scores, kind="stable")[:settings.collaborative_candidates]
+        candidate_ids = np.union1d(game_ids, collaborative_ids[best])
+        blended = (1 - settings.collaborative_weight) * _scores_of(candidate_ids, game_ids, scores)
+        blended += settings.collaborative_weight * _scores_of(candidate_ids, collaborative_ids, collaborative_scores)
+        game_ids, scores = candidate_ids, blended
+    return game_ids, scores
+
+
+# Seeds are collapsed into a few taste vectors, each searched with a larger k,
+# instead of one search per seed. Returns the FAISS labels.
+def search_profile(loaded: LoadedIndex, vectors: np.ndarray, weights: np.ndarray, k: int) -> np.ndarray:
+    queries = build_query_vectors(vectors, weights, settings.profile_max_queries)
+    neighbours = neighbours_per_query(k, len(vectors), len(queries), settings.profile_max_neighbours)
+    _, labels = loaded.index.search(queries, neighbours)
+    return labels
+
+
+# Well rated candidates, best score first
+async def hydrate_candidates(db: AsyncSession, game_ids: np.ndarray, scores: np.ndarray):
     query = select(models.Game).where(
-        models.Game.id.in_(all_game_ids), 
+        models.Game.id.in_(game_ids.tolist()), 
         models.Game.steam_rating > 70
     )
 
     result = await db.execute(query)
     games_db = result.scalars().all()
 
+    score_of = dict(zip(game_ids.tolist(), scores.tolist()))
+    games_db = sorted(games_db, key=lambda game: score_of[game.id], reverse=True)
     return [GameRead(**game.__dict__) for game in games_db]
 
 
+# Content score of the games of each row of neighbour ids (nearest first,
+# -1 padded): 1 for the nearest, decreasing with the rank
+def rank_scores(neighbours: np.ndarray):
+    ranks = np.broadcast_to(np.arange(neighbours.shape[1], dtype=np.float32), neighbours.shape)
+    found = neighbours >= 0
+    return neighbours[found], 1 - ranks[found] / max(neighbours.shape[1], 1)
+
+
+# Scores (of ids) of the wanted ids, 0 for the ones not in ids
+def _scores_of(wanted: np.ndarray, ids: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    order = np.argsort(ids)
+    ids, scores = ids[order], scores[order]
+    positions = np.minimum(np.searchsorted(ids, wanted), max(len(ids) - 1, 0))
+    found = ids[positions] == wanted if len(ids) else np.zeros(len(wanted), dtype=bool)
+    return np.where(found, scores[positions] if len(ids) else 0, 0).astype(np.float32)
+
+
+# Games most similar to one game, nearest first. Read from the precomputed
+# neighbours table, or searched live while it has not been built for the
+# served version. None when the game does not exist.
+async def get_similar_games(db: AsyncSession, game_id: int, k: int = 10):
+    loaded = index_manager.get()
+    table = index_manager.neighbors(loaded)
+    positions, known = loaded.positions([game_id]) if table is not None else (None, [False])
+    if known[0] and k <= table.shape[1]:
+        game_ids = table[positions[0], :k]
+    else:
+        result = await db.execute(games_with_awards_query().where(models.Game.id == game_id))
+        game = result.first()
+        if game is None:
+            return None
+        # As search_candidates, the search runs off the event loop
+        _, labels = await asyncio.get_running_loop().run_in_executor(
+            None, loaded.index.search, game_encoder.encode([game]), k + 1
+        )
+        # Mapped in place, nearest first
+        labels = await map_faiss_labels(db, loaded, labels)
+        game_ids = drop_self(labels, np.array([game_id]), k)[0]
+    game_ids = [int(game_id) for game_id in game_ids if game_id >= 0]
 
-async def get_games_id_from_faiss(db: AsyncSession, faiss_index: int):
-    query = select(models.Game_vectors).filter(models.Game_vectors.faiss_index == faiss_index)
-    result = await db.execute(query)
-    game = result.scalars().first()
-    return game.game_id    
+    result = await db.execute(select(models.Game).where(models.Game.id.in_(game_ids)))
+    games = {game.id: game for game in result.scalars().all()}
+    return [GameRead(**games[game_id].__dict__) for game_id in game_ids if game_id in games]
 
-    
-async def faiss_trainer(db: AsyncSession):
-    games = await get_all_games_as_predictions(db)
-    
-    genres_mapping = {genre: index for index, genre in enumerate(utils.genres)}
-    game_engines_mapping = {engine: index for index, engine in enumerate(utils.game_engines)}
-    award_categories_mapping = {category: index for index, category in enumerate(utils.award_categories)}
-    
-    numpy_arrays = [create_numpy_array_for_game(game, genres_mapping, game_engines_mapping, award_categories_mapping).flatten() for game in games]
-    
-    vectors = np.array(numpy_arrays).astype('float32')
-    dimension = vectors.shape[1]
-    
-    nlist = 670
-    quantizer = faiss.IndexFlatL2(dimension)
-    
-    index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_L2)
-    
-    index.train(vectors)
-    index.add(vectors)
-    
-    faiss.write_index(index, "games.index")
 
-    
-    for i, game in enumerate(games):
-         game_vector = models.game_vectors(game_id=game.id, faiss_index=i)
+# Bumped by every invalidation of a user's recommendations, so a prediction
+# that was running across a write does not cache its result
+recommendation_generations: Counter = Counter()
 
-         db.add(game_vector)
 
-        
-    await db.commit()
\ No newline at end of file
+# Reviews and wishlist entries are the seeds of a user's recommendations,
+# every write to them has to call this once it is committed
+def invalidate_user_recommendations(user_nickname: str):
+    recommendation_generations[user_nickname] += 1
+    recommendation_cache.invalidate_matching(lambda key: key[0] == user_nickname)
+
+
+# Recommendations are only valid for the index version they were searched in
+index_manager.add_listener(lambda loaded: recommendation_cache.clear())
+
+
+# Cached searches miss the games added or renamed since, and can return
+# deleted ones. Registered after the title index, so searches run once the
+# cache is cleared see the rebuilt index.
+async def clear_search_cache(db: AsyncSession):
+    search_cache.clear()
+
+
+catalog_watcher.add_listener(clear_search_cache)
+
+
+# FAISS labels as game ids, in place (-1 for padding and unknown positions)
+async def map_faiss_labels(db: AsyncSession, loaded: LoadedIndex, labels: np.ndarray):
+    if loaded.ids_are_game_ids:
+        return labels
+
+    # Legacy index: labels are row positions, mapped through game_vectors
+    positions = index_manager.legacy_positions
+    if positions is None:
+        positions = await get_game_vectors_positions(db)
+        index_manager.legacy_positions = positions
+
+    valid = (labels >= 0) & (labels < len(positions))
+    return np.where(valid, positions[np.where(valid, labels, 0)] if len(positions) else -1, -1)
+
+
+# Legacy game_vectors table as a compact position -> game id array
+async def get_game_vectors_positions(db: AsyncSession):
+    result = await db.execute(select(models.Game_vectors.faiss_index, models.Game_vectors.game_id))
+    rows = result.all()
+
+    positions = np.full(max((row.faiss_index for row in rows), default=-1) + 1, -1, dtype=np.int64)
+    for row in rows:
+        positions[row.faiss_index] = row.game_id
+    return positions
@@ -7,7 +7,7 @@ from .config import settings
 SQLALCHEMY_DATABASE_URL = settings.database_url
 SQLALCHEMY_ASYNC_DATABASE_URL = settings.async_database_url
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
-async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, echo=True)
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, echo=settings.database_echo)
 
 AsyncSessionLocal = sessionmaker(
     bind=async_engine,
@@ -15,6 +15,7 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+# Sync sessions for scripts and one-off jobs, endpoints use AsyncSessionLocal
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
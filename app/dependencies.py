@@ -1,13 +1,6 @@
-from .database import SessionLocal
 from .database import AsyncSessionLocal
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-        
+# Every endpoint runs on the async engine, the sync one is left to scripts
 async def get_async_db():
     async with AsyncSessionLocal() as session:
         yield session
@@ -0,0 +1,151 @@
+import re
+from operator import attrgetter
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from . import utils
+
+# Bumped whenever the vector of the same game changes (parsing fixes), indexes
+# built with another encoding are retrained instead of patched
+FEATURE_ENCODING = 2
+
+# Catalog strings mix separators ("Action,RPG", "Engine.Unity;SDK.Steamworks")
+SEPARATORS = re.compile(r"[,;|]")
+ENGINE_PREFIX = "Engine."
+
+
+def split_values(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [part.strip() for part in SEPARATORS.split(value) if part.strip()]
+
+
+# Turns games into the feature vectors indexed by FAISS:
+#   [rating, primary genre (0.1), genres one-hot, engines one-hot, awards one-hot]
+#
+# The vocabularies are compiled once. Catalogs repeat the same genres and
+# technologies strings over and over, so each one-hot block is encoded once per
+# distinct value and gathered into a single float32 matrix, instead of
+# building and concatenating small arrays game by game. Games that carry
+# precomputed feature_bits (games.feature_bits, app.features) skip the string
+# parsing for their genres and engines altogether.
+class GameEncoder:
+    def __init__(self, genres: Sequence[str], game_engines: Sequence[str], award_categories: Sequence[str]):
+        self.genres_mapping = {genre: index for index, genre in enumerate(genres)}
+        self.game_engines_mapping = {engine: index for index, engine in enumerate(game_engines)}
+        self.award_categories_mapping = {category: index for index, category in enumerate(award_categories)}
+
+        self.primary_genre_offset = 1
+        self.genres_offset = self.primary_genre_offset + len(genres)
+        self.game_engines_offset = self.genres_offset + len(genres)
+        self.award_categories_offset = self.game_engines_offset + len(game_engines)
+        self.dimension = self.award_categories_offset + len(award_categories)
+        # Genres then engines, the same order as their one-hot blocks
+        self.feature_count = len(genres) + len(game_engines)
+        self.feature_bytes = -(-self.feature_count // 8)
+
+    # Stored with every index build, an index only matches the encoder that built it
+    def vocabulary(self) -> dict:
+        return {
+            "genres": list(self.genres_mapping),
+            "game_engines": list(self.game_engines_mapping),
+            "award_categories": list(self.award_categories_mapping),
+            "dimension": self.dimension,
+        }
+
+    def encode(self, games: Iterable) -> np.ndarray:
+        # games can be GamePrediction objects or raw rows with the same attributes
+        games = games if isinstance(games, Sequence) else list(games)
+        if not games:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        matrix = np.zeros((len(games), self.dimension), dtype=np.float32)
+        self._fill_block(matrix, self.primary_genre_offset, self.genres_offset,
+                         list(map(attrgetter('primary_genre'), games)), self._primary_genre_columns, 0.1)
+
+        bits = [getattr(game, 'feature_bits', None) for game in games]
+        precomputed = np.fromiter((value is not None and len(value) == self.feature_bytes for value in bits),
+                                  dtype=bool, count=len(games))
+        if precomputed.any():
+            packed = np.frombuffer(b"".join(value for value, ready in zip(bits, precomputed) if ready), dtype=np.uint8)
+            unpacked = np.unpackbits(packed.reshape(-1, self.feature_bytes), axis=1, count=self.feature_count)
+            matrix[precomputed, self.genres_offset:self.award_categories_offset] = unpacked
+        if not precomputed.all():
+            parsed = [game for game, ready in zip(games, precomputed) if not ready]
+            block = np.zeros((len(parsed), self.award_categories_offset), dtype=np.float32)
+            self._fill_block(block, self.genres_offset, self.game_engines_offset,
+                             list(map(attrgetter('genres'), parsed)), self._genres_columns)
+            self._fill_block(block, self.game_engines_offset, self.award_categories_offset,
+                             list(map(attrgetter('detected_technologies'), parsed)), self._technologies_columns)
+            matrix[~precomputed, self.genres_offset:self.award_categories_offset] = \
+                block[:, self.genres_offset:self.award_categories_offset]
+
+        #In the future it will be used our rating
+        ratings = np.fromiter(map(float, map(attrgetter('steam_rating'), games)), dtype=np.float64, count=len(games))
+        matrix[:, 0] = ratings * 0.008
+
+        # Awards are sparse, only the games that have some are touched
+        award_rows, award_columns = [], []
+        for row, award_names in enumerate(map(attrgetter('award_names'), games)):
+            if award_names:
+                columns = self._awards_columns(award_names)
+                award_rows.extend([row] * len(columns))
+                award_columns.extend(self.award_categories_offset + column for column in columns)
+        matrix[award_rows, award_columns] = 1
+
+        return matrix
+
+    def encode_game(self, game) -> np.ndarray:
+        return self.encode([game])[0]
+
+    # Bit-packed genres and engines of a game, stored in games.feature_bits
+    def feature_bits(self, genres: Optional[str], detected_technologies: Optional[str]) -> bytes:
+        bits = np.zeros(self.feature_bytes * 8, dtype=bool)
+        bits[self._genres_columns(genres)] = True
+        bits[[len(self.genres_mapping) + column for column in self._technologies_columns(detected_technologies)]] = True
+        return np.packbits(bits).tobytes()
+
+    # Encode each distinct value once and gather it into every row that has it
+    def _fill_block(self, matrix: np.ndarray, start: int, end: int, values: list, columns_for, value: float = 1):
+        codes = dict.fromkeys(values)
+        for code, distinct in enumerate(codes):
+            codes[distinct] = code
+        rows = np.fromiter(map(codes.__getitem__, values), dtype=np.intp, count=len(values))
+
+        template_rows, template_columns = [], []
+        for code, distinct in enumerate(codes):
+            columns = columns_for(distinct)
+            template_rows.extend([code] * len(columns))
+            template_columns.extend(columns)
+
+        template = np.zeros((len(codes), end - start), dtype=np.float32)
+        template[template_rows, template_columns] = value
+        matrix[:, start:end] = template[rows]
+
+    def _primary_genre_columns(self, primary_genre) -> list:
+        if primary_genre in self.genres_mapping:
+            return [self.genres_mapping[primary_genre]]
+        return []
+
+    def _genres_columns(self, genres: Optional[str]) -> list:
+        return [self.genres_mapping[genre] for genre in split_values(genres) if genre in self.genres_mapping]
+
+    # Only engines are features, other technologies (SDKs, ...) are ignored
+    def _technologies_columns(self, detected_technologies: Optional[str]) -> list:
+        columns = []
+        for technology in split_values(detected_technologies):
+            if technology.startswith(ENGINE_PREFIX):
+                technology = technology[len(ENGINE_PREFIX):]
+            if technology in self.game_engines_mapping:
+                columns.append(self.game_engines_mapping[technology])
+        return columns
+
+    def _awards_columns(self, award_names) -> list:
+        # Raw joined rows carry a single award name per row
+        if isinstance(award_names, str):
+            award_names = (award_names,)
+        return [self.award_categories_mapping[award] for award in award_names if award in self.award_categories_mapping]
+
+
+game_encoder = GameEncoder(utils.genres, utils.game_engines, utils.award_categories)
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, utils
+from .catalog import catalog_watcher
+from .config import settings
+from .encoder import GameEncoder, game_encoder
+
+FACETS = ("genre", "engine", "award", "rating")
+
+M1, M2, M4, H01 = (np.uint64(mask) for mask in (0x5555555555555555, 0x3333333333333333,
+                                                 0x0F0F0F0F0F0F0F0F, 0x0101010101010101))
+
+
+# Rows of booleans (values x games) packed into 64-bit words, one bitmap per row
+def pack_bitmaps(matrix: np.ndarray) -> np.ndarray:
+    packed = np.packbits(matrix, axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+# Games of each bitmap row, counting the bits of all the words at once
+# (numpy 1.x has no popcount ufunc, a byte lookup table is four times slower)
+def count_bits(bitmaps: np.ndarray) -> np.ndarray:
+    words = bitmaps - ((bitmaps >> np.uint64(1)) & M1)
+    words = (words & M2) + ((words >> np.uint64(2)) & M2)
+    words = (words + (words >> np.uint64(4))) & M4
+    return ((words * H01) >> np.uint64(56)).sum(axis=-1, dtype=np.int64)
+
+
+# One build of the facet bitmaps. build() replaces the whole snapshot and a
+# search reads it once, so it never mixes positions of two builds.
+@dataclass(frozen=True)
+class FacetSnapshot:
+    # Game ids, best rated first: bit i of every bitmap is ids[i]
+    ids: np.ndarray
+    # One row of words per value of each facet
+    bitmaps: Dict[str, np.ndarray]
+    # Every game set
+    everything: np.ndarray
+    # Counts of every value without filters
+    totals: Dict[str, np.ndarray]
+    built_at: float
+
+
+# Browse filters over the whole catalog, answered from memory: one bitmap of
+# the games per genre, engine (the vocabularies of app/utils.py), award
+# category and steam_rating bucket. Values of a facet are ORed, facets ANDed.
+#
+# Games are numbered best rated first, so the matches come out in that order.
+# The count of each facet value is taken with the filters of the other facets
+# only: a selected genre does not hide the games the other genres would add.
+# Genres and engines come from games.feature_bits when present.
+class FacetIndex:
+    def __init__(self, encoder: GameEncoder, award_categories: Sequence[str], rating_bucket: int = 10):
+        self.encoder = encoder
+        self.rating_bucket = rating_bucket
+        # steam_rating is a percentage, 100 falls in the last bucket
+        ratings = [f"{start}-{start + rating_bucket}" for start in range(0, 100, rating_bucket)]
+        self.values: Dict[str, List[str]] = {
+            "genre": list(encoder.genres_mapping),
+            "engine": list(encoder.game_engines_mapping),
+            "award": list(award_categories),
+            "rating": ratings,
+        }
+        self.rows = {facet: {value: row for row, value in enumerate(values)} for facet, values in self.values.items()}
+        self.snapshot: Optional[FacetSnapshot] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    # games are (id, steam_rating, genres, detected_technologies, feature_bits)
+    # rows, best rated first; awards are (game id, award name) rows
+    def build(self, games: Sequence[tuple], awards: Sequence[Tuple[int, str]]):
+        encoder = self.encoder
+        ids = np.fromiter((game[0] for game in games), dtype=np.int64, count=len(games))
+        positions = {game_id: position for position, game_id in enumerate(ids.tolist())}
+
+        bits = b"".join(
+            game[4] if game[4] is not None and len(game[4]) == encoder.feature_bytes
+            else encoder.feature_bits(game[2], game[3])
+            for game in games
+        )
+        features = np.unpackbits(np.frombuffer(bits, dtype=np.uint8).reshape(len(games), encoder.feature_bytes),
+                                 axis=1, count=encoder.feature_count).T
+        genre_count = len(self.values["genre"])
+
+        award_matrix = np.zeros((len(self.values["award"]), len(games)), dtype=bool)
+        for game_id, name in awards:
+            if name in self.rows["award"] and game_id in positions:
+                award_matrix[self.rows["award"][name], positions[game_id]] = True
+
+        rating_matrix = np.zeros((len(self.values["rating"]), len(games)), dtype=bool)
+        rated = [(position, float(game[1])) for position, game in enumerate(games) if game[1] is not None]
+        if rated:
+            rated_positions, ratings = np.array(rated).T
+            buckets = np.clip(ratings // self.rating_bucket, 0, len(self.values["rating"]) - 1).astype(np.intp)
+            rating_matrix[buckets, rated_positions.astype(np.intp)] = True
+
+        bitmaps = {
+            "genre": pack_bitmaps(features[:genre_count]),
+            "engine": pack_bitmaps(features[genre_count:]),
+            "award": pack_bitmaps(award_matrix),
+            "rating": pack_bitmaps(rating_matrix),
+        }
+        self.snapshot = FacetSnapshot(
+            ids=ids,
+            bitmaps=bitmaps,
+            everything=pack_bitmaps(np.ones((1, len(games)), dtype=bool))[0],
+            totals={facet: count_bits(facet_bitmaps) for facet, facet_bitmaps in bitmaps.items()},
+            built_at=time.time(),
+        )
+
+    # ids of the matching games from offset, best rated first, with the
+    # number of matches and the counts of every facet value. Raises
+    # ValueError on values outside the vocabularies. Nothing matches before
+    # the first build.
+    def search(self, filters: Dict[str, Sequence[str]], offset: int = 0, limit: int = 20
+               ) -> Tuple[List[int], int, Dict[str, Dict[str, int]]]:
+        rows = {}
+        for facet, values in filters.items():
+            if not values:
+                continue
+            unknown = [value for value in values if value not in self.rows[facet]]
+            if unknown:
+                raise ValueError(f"Unknown {facet}: {', '.join(unknown)}")
+            rows[facet] = [self.rows[facet][value] for value in values]
+
+        snapshot = self.snapshot
+        if snapshot is None:
+            return [], 0, {}
+        bitmaps = snapshot.bitmaps
+        selected = {facet: np.bitwise_or.reduce(bitmaps[facet][facet_rows], axis=0)
+                    for facet, facet_rows in rows.items()}
+
+        # None when no filter applies
+        def matching(skip: Optional[str] = None) -> Optional[np.ndarray]:
+            result = None
+            for facet, bitmap in selected.items():
+                if facet != skip:
+                    result = bitmap if result is None else result & bitmap
+            return result
+
+        matched = matching()
+        counts = {}
+        for facet in FACETS:
+            base = matching(facet) if facet in selected else matched
+            if base is None:
+                facet_counts = snapshot.totals[facet]
+            else:
+                # Only the words with some match can count
+                words = np.flatnonzero(base)
+                if len(words) < len(base) // 2:
+                    facet_counts = count_bits(bitmaps[facet][:, words] & base[words])
+                else:
+                    facet_counts = count_bits(bitmaps[facet] & base)
+            counts[facet] = {value: int(count) for value, count in zip(self.values[facet], facet_counts) if count}
+
+        if matched is None:
+            matched = snapshot.everything
+
+        positions = np.flatnonzero(np.unpackbits(matched.view(np.uint8), count=len(snapshot.ids)))
+        return snapshot.ids[positions[offset:offset + limit]].tolist(), len(positions), counts
+
+    # Rebuilt by the catalog watcher whenever the games change, award changes
+    # included (migrations/005_game_awards_touch_games.sql)
+    async def refresh(self, db: AsyncSession):
+        result = await db.execute(
+            select(models.Game.id, models.Game.steam_rating, models.Game.genres,
+                   models.Game.detected_technologies, models.Game.feature_bits)
+            .order_by(models.Game.steam_rating.desc().nulls_last(), models.Game.id)
+        )
+        games = result.all()
+        result = await db.execute(
+            select(models.Game_awards.game_id, models.Award.name)
+            .join(models.Award, models.Award.id == models.Game_awards.award_id)
+        )
+        awards = result.all()
+        await asyncio.get_running_loop().run_in_executor(None, self.build, games, awards)
+
+
+facet_index = FacetIndex(game_encoder, utils.award_categories, settings.facet_rating_bucket)
+catalog_watcher.add_listener(facet_index.refresh)
@@ -0,0 +1,398 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .config import settings
+from .binary_index import BinaryGameIndex, BINARY_INDEX_FILE, BINARY_DATA_FILE, BINARY_META_FILE
+from .encoder import game_encoder
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "games.index"
+IDS_FILE = "ids.npy"
+VOCABULARY_FILE = "vocabulary.json"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+# Files holding the index itself, float or binary
+INDEX_FILES = (INDEX_FILE, BINARY_INDEX_FILE, BINARY_DATA_FILE, BINARY_META_FILE)
+# Share of the probe vectors that must be found among their PROBE_K
+# nearest neighbours for a build to be published
+PROBE_K = 10
+PROBE_MIN_FOUND = 0.9
+# Optional, written after the build by app.neighbors
+NEIGHBORS_FILE = "neighbors.npy"
+
+
+class IndexArtifactError(Exception):
+    pass
+
+
+# An index together with the game ids it stores. Versioned builds carry game
+# ids as FAISS labels (ids is set); the pre-versioning games.index returns row
+# positions that still have to be translated through the legacy game_vectors
+# table (ids is None). meta holds what the incremental update needs: built_at
+# and the training centroid_distance.
+@dataclass(frozen=True)
+class LoadedIndex:
+    index: faiss.Index
+    ids: Optional[np.ndarray] = None
+    meta: dict = field(default_factory=dict)
+    version: Optional[str] = None
+    path: Optional[str] = None
+
+    @property
+    def ids_are_game_ids(self) -> bool:
+        return self.ids is not None
+
+    # Rows of the given game ids in ids (sorted, both builds store them in
+    # id order), and which of them are stored in this version at all
+    def positions(self, game_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.zeros(len(game_ids), dtype=np.intp), np.zeros(len(game_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.ids, game_ids), len(self.ids) - 1)
+        return positions, self.ids[positions] == game_ids
+
+
+# Keeps the trained FAISS index resident in memory for the whole process.
+#
+# Each build is written as a versioned artifact directory (index, id mapping,
+# encoder vocabulary and metadata) next to a CURRENT pointer. A build is
+# written to a temporary directory, validated, renamed into place and only
+# then published, so readers never see a partial file. Requests take one
+# LoadedIndex reference per call, which makes the in-process swap atomic:
+# a request keeps the version it started with. The last faiss_keep_versions
+# builds stay on disk for rollback.
+#
+# With mmap enabled the index is opened read-only and memory mapped, so
+# several workers on one host share its pages. Workers also watch the CURRENT
+# pointer, so a version published or rolled back by one of them is picked up
+# by the others.
+class FaissIndexManager:
+    def __init__(self, directory: str, legacy_path: str, nprobe: int, keep_versions: int,
+                 mmap: bool = False, reload_interval: float = 0, search_params: str = ""):
+        self.directory = directory
+        self.legacy_path = legacy_path
+        self.nprobe = nprobe
+        self.search_params = search_params
+        self.keep_versions = keep_versions
+        self.mmap = mmap
+        self.reload_interval = reload_interval
+        self._loaded: Optional[LoadedIndex] = None
+        self._lock = threading.Lock()
+        self._next_reload_check = 0.0
+        self._listeners: List[Callable[[LoadedIndex], None]] = []
+        # (version, neighbours table or None, next time a missing table is looked for)
+        self._neighbors = (None, None, 0.0)
+        # Compact position -> game id array for the legacy index, filled lazily
+        # from game_vectors during the migration window
+        self.legacy_positions: Optional[np.ndarray] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded is not None
+
+    def load(self) -> LoadedIndex:
+        loaded = self._read_current()
+        self._publish(loaded)
+        logger.info("FAISS index %s loaded (%d vectors)", loaded.version or self.legacy_path, loaded.index.ntotal)
+        return loaded
+
+    def get(self) -> LoadedIndex:
+        loaded = self._loaded
+        if loaded is None:
+            # Lazy fallback for processes started without the lifespan hook
+            with self._lock:
+                if self._loaded is None:
+                    self._loaded = self._read_current()
+                loaded = self._loaded
+        elif self.reload_interval and time.monotonic() >= self._next_reload_check:
+            loaded = self._reload_if_moved(loaded)
+        return loaded
+
+    # Private, writable copy of a served index for in-place updates
+    def writable_copy(self, loaded: LoadedIndex) -> faiss.Index:
+        if isinstance(loaded.index, BinaryGameIndex):
+            index = loaded.index.clone()
+        elif self.mmap:
+            # Memory-mapped inverted lists are read-only and cannot be cloned
+            index = faiss.read_index(os.path.join(loaded.path, INDEX_FILE) if loaded.version else loaded.path)
+        else:
+            index = faiss.clone_index(loaded.index)
+        self._configure(index)
+        return index
+
+    # Called with every newly served version, including ones picked up from
+    # another worker, so derived caches can be dropped
+    def add_listener(self, listener: Callable[[LoadedIndex], None]):
+        self._listeners.append(listener)
+
+    # Precomputed neighbours table of a version, None until app.neighbors has
+    # run for it. Rows follow loaded.ids.
+    def neighbors(self, loaded: LoadedIndex) -> Optional[np.ndarray]:
+        version, table, next_check = self._neighbors
+        if version == loaded.version and (table is not None or time.monotonic() < next_check):
+            return table
+        table = None
+        path = os.path.join(loaded.path, NEIGHBORS_FILE) if loaded.version else None
+        if path and os.path.exists(path):
+            table = np.load(path, mmap_mode="r" if self.mmap else None)
+            if len(table) != len(loaded.ids):
+                logger.warning("Ignoring %s, it does not match the version ids", path)
+                table = None
+        self._neighbors = (loaded.version, table, time.monotonic() + self.reload_interval)
+        return table
+
+    def save_neighbors(self, loaded: LoadedIndex, table: np.ndarray) -> str:
+        path = os.path.join(loaded.path, NEIGHBORS_FILE)
+        staging = os.path.join(loaded.path, f".{NEIGHBORS_FILE}")
+        with open(staging, "wb") as staging_file:
+            np.save(staging_file, table)
+        os.replace(staging, path)
+        # Served right away by this process, other workers find the file on
+        # their next check
+        self._neighbors = (None, None, 0.0)
+        return path
+
+    def get_index(self) -> faiss.Index:
+        return self.get().index
+
+    # Write a new version, validate it, make it current and serve it.
+    # probe vectors, when given, must find their own probe_ids.
+    def save(self, index: faiss.Index, ids: np.ndarray, meta: dict,
+             probe: Optional[np.ndarray] = None, probe_ids: Optional[np.ndarray] = None) -> LoadedIndex:
+        os.makedirs(self.directory, exist_ok=True)
+        version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        staging = os.path.join(self.directory, f".staging-{version}")
+        os.makedirs(staging)
+        try:
+            if isinstance(index, BinaryGameIndex):
+                index.write(staging)
+            else:
+                faiss.write_index(index, os.path.join(staging, INDEX_FILE))
+            np.save(os.path.join(staging, IDS_FILE), ids)
+            _write_json(os.path.join(staging, VOCABULARY_FILE), game_encoder.vocabulary())
+            _write_json(os.path.join(staging, META_FILE), dict(meta, version=version, vectors=int(index.ntotal)))
+
+            loaded = self._read_version(staging, version)
+            self._validate(loaded, probe, probe_ids)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        os.rename(staging, self._version_path(version))
+        self._write_current(version)
+        self._publish(loaded)
+        self._prune()
+        logger.info("FAISS index %s published (%d vectors)", version, loaded.index.ntotal)
+        return loaded
+
+    def versions(self) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        current = self._current_version()
+        versions = []
+        for version in sorted(os.listdir(self.directory)):
+            meta_path = os.path.join(self.directory, version, META_FILE)
+            if version.startswith(".") or not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            versions.append(dict(meta, version=version, current=version == current))
+        return versions
+
+    # Serve an older version again, by default the one before the current
+    def rollback(self, version: Optional[str] = None) -> LoadedIndex:
+        available = [item["version"] for item in self.versions()]
+        current = self._current_version()
+        if version is None:
+            older = [item for item in available if current is None or item < current]
+            if not older:
+                raise IndexArtifactError("There is no previous index version")
+            version = older[-1]
+        if version not in available:
+            raise IndexArtifactError(f"Index version {version} not found")
+
+        loaded = self._read_version(self._version_path(version), version)
+        self._validate(loaded)
+        self._write_current(version)
+        self._publish(loaded)
+        logger.info("FAISS index rolled back to %s", version)
+        return loaded
+
+    def _reload_if_moved(self, loaded: LoadedIndex) -> LoadedIndex:
+        self._next_reload_check = time.monotonic() + self.reload_interval
+        version = self._current_version()
+        if version is None or version == loaded.version:
+            return loaded
+        try:
+            loaded = self._read_version(self._version_path(version), version)
+        except (RuntimeError, OSError, IndexArtifactError):
+            logger.exception("Could not load FAISS index %s, keeping %s", version, loaded.version)
+            return self._loaded
+        self._publish(loaded)
+        logger.info("FAISS index %s picked up from %s", version, CURRENT_FILE)
+        return loaded
+
+    def _publish(self, loaded: LoadedIndex):
+        with self._lock:
+            self._loaded = loaded
+            self.legacy_positions = None
+        for listener in self._listeners:
+            listener(loaded)
+
+    def _read_current(self) -> LoadedIndex:
+        version = self._current_version()
+        if version is None:
+            return self._read_legacy()
+        return self._read_version(self._version_path(version), version)
+
+    def _read_version(self, path: str, version: str) -> LoadedIndex:
+        with open(os.path.join(path, VOCABULARY_FILE)) as vocabulary_file:
+            if json.load(vocabulary_file) != game_encoder.vocabulary():
+                raise IndexArtifactError(f"Index version {version} was built with a different encoder vocabulary")
+        if os.path.exists(os.path.join(path, BINARY_META_FILE)):
+            # Binary builds are small and always read into memory
+            index = BinaryGameIndex.read(path, game_encoder)
+            self._configure(index)
+        else:
+            index = self._read_index(os.path.join(path, INDEX_FILE))
+        ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r" if self.mmap else None)
+        with open(os.path.join(path, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        # Staged builds are renamed into place once validated
+        return LoadedIndex(index, ids, meta, version, self._version_path(version))
+
+    def _read_legacy(self) -> LoadedIndex:
+        return LoadedIndex(self._read_index(self.legacy_path), path=self.legacy_path)
+
+    def _read_index(self, path: str) -> faiss.Index:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.mmap else 0
+        index = faiss.read_index(path, flags)
+        self._configure(index)
+        if self.mmap:
+            _disable_prefetch(index)
+        return index
+
+    def _validate(self, loaded: LoadedIndex, probe: Optional[np.ndarray] = None, probe_ids: Optional[np.ndarray] = None):
+        index, ids = loaded.index, loaded.ids
+        if index.d != game_encoder.dimension:
+            raise IndexArtifactError(f"Index dimension {index.d} does not match the encoder ({game_encoder.dimension})")
+        if index.ntotal != len(ids) or len(np.unique(ids)) != len(ids):
+            raise IndexArtifactError("Index vectors and game ids do not match")
+        if probe is not None and len(probe):
+            # Compressed (PQ) and graph (HNSW) indexes are approximate: a
+            # vector may rank behind duplicates or miss itself now and then
+            _, labels = index.search(probe, PROBE_K)
+            found = (labels == np.asarray(probe_ids)[:, None]).any(axis=1)
+            if found.mean() < PROBE_MIN_FOUND:
+                raise IndexArtifactError("Index does not find its own vectors")
+
+    def _configure(self, index: faiss.Index):
+        # Search parameters are set once here instead of per request, so
+        # readers never mutate the shared index
+        if self.search_params and not isinstance(index, BinaryGameIndex):
+            faiss.ParameterSpace().set_index_parameters(index, self.search_params)
+        elif hasattr(index, "nprobe"):
+            index.nprobe = self.nprobe
+
+    def _version_path(self, version: str) -> str:
+        return os.path.join(self.directory, version)
+
+    def _current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as current_file:
+                return current_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_current(self, version: str):
+        # os.replace is atomic, the pointer always names a complete version
+        staging = os.path.join(self.directory, f".{CURRENT_FILE}-{version}")
+        with open(staging, "w") as current_file:
+            current_file.write(version)
+        os.replace(staging, os.path.join(self.directory, CURRENT_FILE))
+
+    def _prune(self):
+        current = self._current_version()
+        versions = [item["version"] for item in self.versions()]
+        for version in versions[:-self.keep_versions]:
+            if version != current:
+                shutil.rmtree(self._version_path(version), ignore_errors=True)
+
+
+# Empty index for a faiss.index_factory spec, e.g. "IVF{nlist},Flat",
+# "IVF{nlist},PQ23", "HNSW32" or "Flat". Indexes without their own id
+# storage are wrapped in an IDMap, so every index takes game ids as labels.
+def create_index(spec: str, dimension: int, nlist: int) -> faiss.Index:
+    spec = spec.format(nlist=nlist)
+    index = faiss.index_factory(dimension, spec, faiss.METRIC_L2)
+    if ivf_index(index) is None and not isinstance(index, faiss.IndexIDMap):
+        index = faiss.index_factory(dimension, f"IDMap,{spec}", faiss.METRIC_L2)
+    return index
+
+
+# The IVF part of an index, None for flat and graph indexes
+def ivf_index(index: faiss.Index) -> Optional[faiss.IndexIVF]:
+    if isinstance(index, BinaryGameIndex):
+        return None
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+# Incremental updates remove and re-add vectors, which IVF, flat and binary
+# storage support and HNSW graphs do not
+def supports_incremental(index: faiss.Index) -> bool:
+    if isinstance(index, BinaryGameIndex) or ivf_index(index) is not None:
+        return True
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return isinstance(index, faiss.IndexFlat)
+
+
+# Mapped IVF lists are served by OnDiskInvertedLists, which starts prefetch
+# threads on every search. The pages are already in the shared page cache, and
+# those threads cost more than the scan itself.
+def _disable_prefetch(index: faiss.Index):
+    ivf = ivf_index(index)
+    if ivf is None:
+        return
+    invlists = faiss.downcast_InvertedLists(ivf.invlists)
+    if hasattr(invlists, "prefetch_nthread"):
+        invlists.prefetch_nthread = 0
+
+
+# Removes each game from its own row and keeps the k nearest others
+def drop_self(labels: np.ndarray, game_ids: np.ndarray, k: int) -> np.ndarray:
+    others = labels != game_ids[:, None]
+    # Stable sort moves the game (and nothing else) to the end of its row
+    order = np.argsort(~others, axis=1, kind="stable")
+    labels = np.take_along_axis(np.where(others, labels, -1), order, axis=1)
+    return labels[:, :k]
+
+
+def _write_json(path: str, data: dict):
+    with open(path, "w") as json_file:
+        json.dump(data, json_file)
+
+
+index_manager = FaissIndexManager(
+    settings.faiss_index_dir,
+    settings.faiss_index_path,
+    settings.faiss_nprobe,
+    settings.faiss_keep_versions,
+    mmap=settings.faiss_mmap,
+    reload_interval=settings.faiss_reload_interval,
+    search_params=settings.faiss_search_params,
+)
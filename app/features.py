@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+from .encoder import game_encoder
+
+logger = logging.getLogger(__name__)
+
+
+# Ingestion step: fills games.feature_bits (GameEncoder.feature_bits) for the
+# games that have none, new games or games whose genres or technologies
+# changed (a trigger resets the column, see
+# migrations/002_games_feature_bits.sql). everything=True recomputes every
+# game, needed after the vocabularies in utils change. Returns the number of
+# games written.
+#
+#   python -m app.features [--all]
+async def refresh_feature_bits(db: AsyncSession, everything: bool = False, batch_size: Optional[int] = None) -> int:
+    batch_size = batch_size or settings.train_chunk_size
+    query = select(models.Game.id, models.Game.genres, models.Game.detected_technologies)
+    if not everything:
+        query = query.where(models.Game.feature_bits.is_(None))
+    rows = (await db.execute(query)).all()
+
+    statement = (
+        update(models.Game.__table__)
+        .where(models.Game.__table__.c.id == bindparam("game_id"))
+        .values(feature_bits=bindparam("bits"))
+    )
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        await db.execute(statement, [
+            {"game_id": row.id, "bits": game_encoder.feature_bits(row.genres, row.detected_technologies)} for row in batch
+        ])
+        await db.commit()
+    if rows:
+        logger.info("Feature bits written for %d games", len(rows))
+    return len(rows)
+
+
+async def main(everything: bool = False):
+    async with AsyncSessionLocal() as db:
+        print(await refresh_feature_bits(db, everything))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute the genre and engine bits of every game")
+    parser.add_argument("--all", action="store_true", help="recompute every game, not only the missing ones")
+    args = parser.parse_args()
+    asyncio.run(main(args.all))
@@ -1,6 +1,13 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import games, users, reviews
+from app.api.endpoints import games, users, reviews, admin
+from app.faiss_index import index_manager, IndexArtifactError
+from app.config import settings
+from app.popular import refresh_popular_games_periodically
+from app.catalog import watch_catalog_periodically
+import logging
 import os
 # variables s
 from dotenv import load_dotenv
@@ -8,7 +15,27 @@ from dotenv import load_dotenv
 # Here we load the .env file
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the FAISS index once per process, it is shared by every request
+    try:
+        index_manager.load()
+    except (RuntimeError, OSError, IndexArtifactError):
+        logger.exception("Could not load the FAISS index, predictions will be unavailable until it is trained")
+    # Fallback of the predictions that run out of time
+    popular_refresh = asyncio.create_task(refresh_popular_games_periodically(settings.popular_refresh_interval))
+    # Title index, suggestions and search cache follow the games table; title
+    # search scans it until the index is built
+    catalog_watch = asyncio.create_task(watch_catalog_periodically(settings.catalog_check_interval))
+    yield
+    popular_refresh.cancel()
+    catalog_watch.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 origins = {
@@ -25,11 +52,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],    
     allow_headers=["*"],
+    expose_headers=["X-Partial-Result"],
 )
 
 app.include_router(users.router)
 app.include_router(games.router)
 app.include_router(reviews.router)
+app.include_router(admin.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, Numeric
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, Numeric, DateTime, LargeBinary, Computed, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 #from sqlalchemy.orm import relationship
 from app.database import Base
 from passlib.context import CryptContext
@@ -23,6 +25,22 @@ class Game(Base):
     publisher = Column(String)
     detected_technologies = Column(String)
     developer = Column(String)
+    # Kept current by triggers, also on award changes (migrations/001 and 005),
+    # read by the incremental index update
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Bit-packed genres and engines (GameEncoder.feature_bits), filled by
+    # app.features and reset when genres or detected_technologies change
+    # (migrations/002_games_feature_bits.sql)
+    feature_bits = Column(LargeBinary)
+    # Weighted title, developer and publisher words for the full-text search,
+    # generated by the database (migrations/004_games_search_vector.sql) and
+    # only loaded when asked for
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(developer, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(publisher, '')), 'C')",
+        persisted=True,
+    )))
 
     def to_dict(self):
         return {
@@ -87,6 +105,8 @@ class Users_wishlist(Base):
     game_id = Column(Integer, ForeignKey('games.id'), primary_key=True)
     user_nickname = Column(String(16), ForeignKey('users.nickname'), primary_key=True)
     
+# Legacy FAISS position -> game id mapping. New indexes store game ids directly,
+# this table is only read for indexes trained before that change.
 class Game_vectors(Base):
     __tablename__ = 'game_vectors'
     game_id = Column(Integer, ForeignKey('games.id'), primary_key=True)
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+from .config import settings
+from .database import AsyncSessionLocal
+from .encoder import game_encoder
+from .faiss_index import index_manager, drop_self
+
+logger = logging.getLogger(__name__)
+
+
+# Precomputes the top-k neighbours of every game of the served index version
+# and stores them next to it, as a neighbours.npy matrix whose rows follow the
+# version's ids.npy (game ids, nearest first, -1 padded, the game itself
+# excluded). "More like this" and the seeds of a prediction then become array
+# lookups instead of FAISS searches.
+#
+# Meant to run nightly, after training, from its own process:
+#
+#   python -m app.neighbors --k 50
+async def build_neighbors(db: AsyncSession, k: Optional[int] = None, batch_size: Optional[int] = None) -> dict:
+    k = k or settings.neighbors_k
+    batch_size = batch_size or settings.train_chunk_size
+    started = time.perf_counter()
+    loaded = index_manager.get()
+    if not loaded.ids_are_game_ids:
+        raise ValueError("The served index predates versioned builds, train it first")
+
+    ids = np.asarray(loaded.ids)
+    # Game ids fit in 32 bits, which halves the table
+    dtype = np.int32 if len(ids) == 0 or ids.max() <= np.iinfo(np.int32).max else np.int64
+    neighbors = np.full((len(ids), k), -1, dtype=dtype)
+
+    # Vectors are re-encoded from the catalog, only the games stored in this
+    # version are kept
+    async for rows in crud.stream_games_with_awards(db, batch_size):
+        game_ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+        positions, stored = loaded.positions(game_ids)
+        if not stored.any():
+            continue
+        vectors = game_encoder.encode([row for row, keep in zip(rows, stored) if keep])
+        # One extra neighbour, the game finds itself
+        _, labels = loaded.index.search(vectors, k + 1)
+        neighbors[positions[stored]] = drop_self(labels, game_ids[stored], k)
+
+    path = index_manager.save_neighbors(loaded, neighbors)
+    report = {
+        "version": loaded.version,
+        "games": len(ids),
+        "k": k,
+        "megabytes": round(neighbors.nbytes / 2 ** 20, 2),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info("Neighbours written to %s: %s", path, report)
+    return report
+
+
+async def main(k: Optional[int] = None):
+    async with AsyncSessionLocal() as db:
+        print(await build_neighbors(db, k))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute the nearest neighbours of every game")
+    parser.add_argument("--k", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.k))
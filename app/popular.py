@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+from .schemas import GameRead
+
+logger = logging.getLogger(__name__)
+
+
+# Best rated games of each primary genre, kept in memory by every worker and
+# refreshed in the background. Predictions that run out of time are completed
+# from it without touching the database.
+class PopularGames:
+    def __init__(self, per_genre: int):
+        self.per_genre = per_genre
+        self.by_genre: Dict[str, List[GameRead]] = {}
+        # Every genre's list merged, best rated first
+        self.overall: List[GameRead] = []
+        self.refreshed_at: Optional[float] = None
+
+    async def refresh(self, db: AsyncSession):
+        rank = func.row_number().over(
+            partition_by=models.Game.primary_genre,
+            order_by=(models.Game.steam_rating.desc().nulls_last(), models.Game.id),
+        ).label("genre_rank")
+        ranked = select(models.Game.id, rank).subquery()
+        query = (
+            select(models.Game)
+            .join(ranked, ranked.c.id == models.Game.id)
+            .where(ranked.c.genre_rank <= self.per_genre)
+            .order_by(models.Game.steam_rating.desc().nulls_last(), models.Game.id)
+        )
+        result = await db.execute(query)
+        overall = [GameRead(**game.__dict__) for game in result.scalars().all()]
+
+        by_genre: Dict[str, List[GameRead]] = {}
+        for game in overall:
+            by_genre.setdefault(game.primary_genre, []).append(game)
+        self.by_genre, self.overall = by_genre, overall
+        self.refreshed_at = time.time()
+
+    # Up to count games, taken round-robin from the given genres (most
+    # weighted first) and then from every genre, skipping exclude ids
+    def fill(self, genres: Counter, exclude: Iterable[int], count: int) -> List[GameRead]:
+        exclude = set(exclude)
+        games = []
+        queues = [iter(self.by_genre.get(genre, [])) for genre, _ in genres.most_common()]
+        while queues and len(games) < count:
+            for queue in list(queues):
+                game = next((game for game in queue if game.id not in exclude), None)
+                if game is None:
+                    queues.remove(queue)
+                    continue
+                exclude.add(game.id)
+                games.append(game)
+                if len(games) == count:
+                    break
+        for game in self.overall:
+            if len(games) >= count:
+                break
+            if game.id not in exclude:
+                exclude.add(game.id)
+                games.append(game)
+        return games
+
+
+popular_games = PopularGames(settings.popular_per_genre)
+
+
+# Started with the application, runs until it shuts down
+async def refresh_popular_games_periodically(interval: float):
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await popular_games.refresh(db)
+            logger.info("Popular games refreshed: %d games", len(popular_games.overall))
+        except Exception:
+            logger.exception("Could not refresh the popular games")
+        await asyncio.sleep(interval)
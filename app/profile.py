@@ -0,0 +1,33 @@
+import math
+
+import faiss
+import numpy as np
+
+
+# Collapses a user's seed vectors (reviewed, wishlisted and similar-title games)
+# into at most max_queries representative query vectors.
+#
+# Seeds that are close in feature space return mostly the same neighbours, so
+# they are grouped with a weighted k-means: each centroid is the
+# weight-averaged taste of one group, and highly rated seeds pull it harder.
+# Small seed sets are searched as they are.
+def build_query_vectors(vectors: np.ndarray, weights: np.ndarray, max_queries: int, seed: int = 1234) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    # Repeated seeds only add weight
+    unique, inverse = np.unique(vectors, axis=0, return_inverse=True)
+    if len(unique) <= max_queries:
+        return unique
+
+    unique_weights = np.bincount(inverse.ravel(), weights=weights, minlength=len(unique)).astype(np.float32)
+    kmeans = faiss.Kmeans(unique.shape[1], max_queries, niter=20, seed=seed,
+                          min_points_per_centroid=1, max_points_per_centroid=len(unique))
+    kmeans.train(unique, weights=unique_weights)
+    return kmeans.centroids
+
+
+# Neighbours to ask for per query so that fewer queries still cover about as
+# many candidates as one search per seed did
+def neighbours_per_query(k: int, seeds: int, queries: int, max_k: int) -> int:
+    if queries == 0:
+        return k
+    return max(k, min(max_k, math.ceil(k * seeds / queries)))
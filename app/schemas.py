@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator, EmailStr
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Any
 from datetime import date
 from passlib.context import CryptContext
 
@@ -44,9 +44,29 @@ class GamePrediction(BaseModel):
     detected_technologies: str
     award_names: List[str]
     
-class GamePredictionTrain(GamePrediction):
+# A game the user's recommendations start from, weighted by how much it says
+# about the user's taste
+class GameSeed(GamePrediction):
     id: int
-    pass
+    weight: float = 1.0
+    feature_bits: Optional[bytes] = None
+
+# A page of the games matching the browse filters, with how many games each
+# facet value matches
+class GameBrowse(BaseModel):
+    total: int
+    games: List[GameRead]
+    facets: Dict[str, Dict[str, int]]
+
+# A page of the full-text search results, best ranked first
+class GameSearchPage(BaseModel):
+    total: int
+    games: List[GameRead]
+
+# A title suggested while the user types
+class GameSuggestion(BaseModel):
+    id: int
+    title: str
 
 class GameUpdate(BaseModel):
     title: Optional[str]
@@ -180,6 +200,19 @@ class GameVectors(BaseModel):
     game_id: int
     faiss_index: int
 
+class TrainingJobRead(BaseModel):
+    id: str
+    mode: str
+    status: str
+    phase: Optional[str] = None
+    vectors: int
+    elapsed: float
+    report: Optional[dict] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
 #Auth
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .catalog import catalog_watcher
+from .config import settings
+
+
+def trigrams(text: str) -> set:
+    return {text[start:start + 3] for start in range(len(text) - 2)}
+
+
+# One build of the title index. build() replaces the whole snapshot and a
+# search reads it once, so it never mixes positions of two builds.
+@dataclass(frozen=True)
+class TitleSnapshot:
+    ids: np.ndarray
+    # Lowercase titles
+    titles: List[str]
+    lengths: np.ndarray
+    postings: Dict[str, np.ndarray]
+    # Position of each title in (length, id) order, and that order
+    rank: np.ndarray
+    by_rank: np.ndarray
+    built_at: float
+
+    # Positions of the titles that may contain every word, None for all of them
+    def candidates(self, words: List[str]) -> Optional[np.ndarray]:
+        grams = set().union(*(trigrams(word) for word in words))
+        if not grams:
+            return None
+        lists = [self.postings.get(gram) for gram in grams]
+        if any(positions is None for positions in lists):
+            return np.zeros(0, dtype=np.int32)
+        lists.sort(key=len)
+        positions = lists[0]
+        for other in lists[1:]:
+            positions = np.intersect1d(positions, other, assume_unique=True)
+            if len(positions) == 0:
+                break
+        return positions
+
+    # (position, summed edit distance) of every match, in (length, id) order
+    def matches(self, title: str, max_distance: int) -> Iterator[Tuple[int, int]]:
+        words = title.strip().lower().split()
+        if not words:
+            return
+        positions = self.candidates(words)
+        if positions is None:
+            ordered = self.by_rank
+        else:
+            ordered = positions[np.argsort(self.rank[positions], kind="stable")]
+
+        words_length = sum(map(len, words))
+        for position in ordered.tolist():
+            distance = len(words) * int(self.lengths[position]) - words_length
+            # Longer titles only get further away
+            if distance > max_distance * len(words):
+                return
+            text = self.titles[position]
+            if all(word in text for word in words):
+                yield position, distance
+
+    def search(self, title: str, max_distance: int, limit: int) -> List[Tuple[int, int]]:
+        return [(int(self.ids[position]), distance)
+                for position, distance in islice(self.matches(title, max_distance), limit)]
+
+    # As search, with one game per title (the lowest id) and equal distances
+    # ordered by title, as crud.get_games_similar_to_titles does in SQL
+    def search_titles(self, title: str, max_distance: int, limit: int) -> List[Tuple[int, int]]:
+        found: Dict[str, Tuple[int, int]] = {}
+        for position, distance in self.matches(title, max_distance):
+            text = self.titles[position]
+            # Matches come by distance: past the limit, only ties can still rank
+            if len(found) >= limit and distance > max(found.values())[0]:
+                break
+            if text not in found:
+                found[text] = (distance, int(self.ids[position]))
+        ranked = sorted(found.items(), key=lambda item: (item[1][0], item[0]))[:limit]
+        return [(game_id, distance) for _, (distance, game_id) in ranked]
+
+
+# In-memory trigram index over the lowercase game titles, for the fuzzy title
+# search (crud.get_games_by_similar_title).
+#
+# The search keeps the titles that contain every word of the query, then ranks
+# them by the sum over the words of levenshtein(lower(title), word). Candidates
+# come from intersecting the posting lists of the words' trigrams, and are
+# checked with a substring test (words under three characters have no trigram
+# and are only checked). For a word contained in the title, the edit distance
+# is exactly len(title) - len(word): the length difference is a lower bound
+# and deleting the other characters reaches it. The ranking is therefore by
+# title length, and candidates are visited shortest first so the search stops
+# after limit matches.
+class TitleIndex:
+    def __init__(self):
+        self.snapshot: Optional[TitleSnapshot] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def build(self, rows: Sequence[Tuple[int, str]]):
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        titles = [(row[1] or "").lower() for row in rows]
+        lengths = np.fromiter(map(len, titles), dtype=np.int32, count=len(titles))
+
+        postings = defaultdict(list)
+        for position, title in enumerate(titles):
+            for gram in trigrams(title):
+                postings[gram].append(position)
+
+        by_rank = np.lexsort((ids, lengths)).astype(np.int32)
+        rank = np.empty(len(ids), dtype=np.int32)
+        rank[by_rank] = np.arange(len(ids), dtype=np.int32)
+
+        self.snapshot = TitleSnapshot(
+            ids=ids, titles=titles, lengths=lengths, rank=rank, by_rank=by_rank,
+            postings={gram: np.asarray(positions, dtype=np.int32) for gram, positions in postings.items()},
+            built_at=time.time(),
+        )
+
+    # (game id, summed edit distance) of the best matches, closest first
+    def search(self, title: str, max_distance: int = 40, limit: int = 10) -> List[Tuple[int, int]]:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return []
+        return snapshot.search(title, max_distance, limit)
+
+    def search_titles(self, title: str, max_distance: int = 40, limit: int = 10) -> List[Tuple[int, int]]:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return []
+        return snapshot.search_titles(title, max_distance, limit)
+
+    # Rebuilt by the catalog watcher whenever the games change
+    async def refresh(self, db: AsyncSession):
+        result = await db.execute(select(models.Game.id, models.Game.title))
+        rows = result.all()
+        await asyncio.get_running_loop().run_in_executor(None, self.build, rows)
+
+
+title_index = TitleIndex()
+if settings.title_search_index:
+    catalog_watcher.add_listener(title_index.refresh)
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import os
+import resource
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+import faiss
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+from .config import settings
+from .database import AsyncSessionLocal
+from .encoder import game_encoder, FEATURE_ENCODING
+from .features import refresh_feature_bits
+from .binary_index import BinaryGameIndex
+from .faiss_index import index_manager, create_index, ivf_index, supports_incremental, INDEX_FILES
+
+logger = logging.getLogger(__name__)
+
+MB = 2 ** 20
+INCREMENTAL_OVERLAP = timedelta(minutes=1)
+
+# Encoding and FAISS work run here instead of on the event loop. FAISS
+# releases the GIL, so requests keep being served while an index is built.
+training_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-trainer")
+
+
+@dataclass
+class TrainingJob:
+    id: str
+    mode: str = "full"  # full, incremental
+    status: str = "pending"  # pending, running, completed, failed
+    phase: Optional[str] = None  # load, encode, train, add, persist
+    vectors: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    report: Optional[dict] = None
+    error: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return round((self.finished_at or time.time()) - self.started_at, 2)
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("pending", "running")
+
+
+async def _run_cpu(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(training_executor, function, *args)
+
+
+# Mean squared distance of vectors to their closest IVF centroid, None for
+# indexes without centroids
+def _mean_centroid_distance(index: faiss.Index, vectors: np.ndarray) -> Optional[float]:
+    ivf = ivf_index(index)
+    if ivf is None:
+        return None
+    if len(vectors) == 0:
+        return 0.0
+    distances, _ = ivf.quantizer.search(vectors, 1)
+    return float(distances.mean())
+
+
+# Builds the games index without holding the whole catalog in memory:
+# the IVF quantizer is trained on a bounded random sample, then the catalog is
+# streamed with a server-side cursor and added chunk by chunk. At most one
+# sample or one chunk of vectors lives outside the index at any time, and both
+# are capped by settings.train_buffer_mb.
+async def faiss_trainer(db: AsyncSession, job: Optional[TrainingJob] = None):
+    job = job or TrainingJob(id="inline")
+    started = time.perf_counter()
+    dimension = game_encoder.dimension
+    max_rows = max(1, settings.train_buffer_mb * MB // (dimension * 4))
+    sample_size = min(settings.train_sample_size, max_rows)
+    chunk_size = min(settings.train_chunk_size, max_rows)
+    buffered_peak = 0
+
+    job.phase = "load"
+    await refresh_feature_bits(db)
+    # Database time, so the next incremental update picks up every change
+    # made while this build runs
+    built_at = await crud.get_database_now(db)
+    sample_games = await crud.get_games_training_sample(db, sample_size)
+    job.phase = "encode"
+    sample = await _run_cpu(game_encoder.encode, sample_games)
+    del sample_games
+    if len(sample) == 0:
+        raise ValueError("There are no games to train the index")
+    buffered_peak = max(buffered_peak, sample.nbytes)
+    sample_rows = len(sample)
+
+    job.phase = "train"
+    # Small catalogs cannot fill every list
+    nlist = min(settings.faiss_nlist, sample_rows)
+    if settings.faiss_binary:
+        index = BinaryGameIndex(game_encoder, min(settings.faiss_binary_nlist, sample_rows),
+                                settings.faiss_binary_rating_bits, settings.faiss_binary_rerank_factor)
+    else:
+        index = create_index(settings.faiss_index_factory, dimension, nlist)
+    if not index.is_trained:
+        await _run_cpu(index.train, sample)
+    centroid_distance = await _run_cpu(_mean_centroid_distance, index, sample)
+    del sample
+
+    job.phase = "add"
+    ids_chunks = []
+    async for rows in crud.stream_games_with_awards(db, chunk_size):
+        vectors = await _run_cpu(game_encoder.encode, rows)
+        ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+        # Game ids are stored as FAISS labels, searches return them directly
+        await _run_cpu(index.add_with_ids, vectors, ids)
+        ids_chunks.append(ids)
+        buffered_peak = max(buffered_peak, vectors.nbytes)
+        job.vectors = int(index.ntotal)
+        # A few stored vectors to validate the written artifact with
+        probe, probe_ids = vectors[:16].copy(), ids[:16]
+    # The catalog may have been emptied since the sample was read
+    if not ids_chunks:
+        raise ValueError("There are no games to train the index")
+    ids = np.concatenate(ids_chunks)
+
+    job.phase = "persist"
+    meta = {
+        "built_at": built_at.isoformat(),
+        "index_factory": _index_spec(),
+        "nlist": nlist,
+        "centroid_distance": centroid_distance,
+        "feature_encoding": FEATURE_ENCODING,
+    }
+    loaded = await _run_cpu(index_manager.save, index, ids, meta, probe, probe_ids)
+
+    report = {
+        "mode": "full",
+        "version": loaded.version,
+        "vectors": int(index.ntotal),
+        "index_factory": _index_spec().format(nlist=nlist),
+        "sample_size": sample_rows,
+        "chunk_size": chunk_size,
+        "seconds": round(time.perf_counter() - started, 2),
+        "buffer_peak_mb": round(buffered_peak / MB, 2),
+        "index_mb": round(sum(
+            os.path.getsize(os.path.join(loaded.path, name)) for name in INDEX_FILES
+            if os.path.exists(os.path.join(loaded.path, name))
+        ) / MB, 2),
+        # ru_maxrss is reported in KiB on Linux
+        "process_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+    logger.info("FAISS index trained: %s", report)
+    return report
+
+
+# Re-encodes only the games added, modified or removed since the live index
+# was built and patches them into a copy of it, keeping the trained quantizer.
+# Award changes reach games.updated_at through the triggers of
+# migrations/005_game_awards_touch_games.sql. Nothing is saved when no game
+# changed.
+# Falls back to a full retrain when the index predates incremental updates, when
+# faiss_index_factory or the feature encoding changed, when the index cannot
+# remove vectors (HNSW), when too many games changed, or when the changed
+# vectors drift away from the IVF centroids (their mean distance grows past
+# incremental_drift_ratio).
+async def faiss_incremental_update(db: AsyncSession, job: Optional[TrainingJob] = None):
+    job = job or TrainingJob(id="inline")
+    started = time.perf_counter()
+    loaded = index_manager.get()
+    if not loaded.ids_are_game_ids or "built_at" not in loaded.meta:
+        return await _full_retrain(db, job, "index has no incremental metadata")
+    # Builds from before the index type became configurable were IVF-Flat
+    if loaded.meta.get("index_factory", "IVF{nlist},Flat") != _index_spec():
+        return await _full_retrain(db, job, "index type changed")
+    if not supports_incremental(loaded.index):
+        return await _full_retrain(db, job, "index type does not support removing vectors")
+    # Builds from before feature_bits never matched an engine
+    if loaded.meta.get("feature_encoding", 1) != FEATURE_ENCODING:
+        return await _full_retrain(db, job, "feature encoding changed")
+
+    job.phase = "load"
+    await refresh_feature_bits(db)
+    built_at = await crud.get_database_now(db)
+    # now() is the transaction start time, so a write that started before the
+    # last build but committed after it carries an older timestamp. Games in
+    # this overlap are simply replaced again.
+    since = datetime.fromisoformat(loaded.meta["built_at"]) - INCREMENTAL_OVERLAP
+    changed = await crud.get_games_changed_since(db, since)
+    removed_ids = np.setdiff1d(loaded.ids, await crud.get_all_game_ids(db))
+    changed_ids = np.fromiter((row.id for row in changed), dtype=np.int64, count=len(changed))
+
+    # A new version would drop the precomputed neighbours and the cached
+    # recommendations for nothing
+    if not len(changed_ids) and not len(removed_ids):
+        report = {
+            "mode": "incremental",
+            "version": loaded.version,
+            "vectors": int(loaded.index.ntotal),
+            "changed": 0,
+            "removed": 0,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info("FAISS index already up to date: %s", report)
+        return report
+
+    if len(changed_ids) + len(removed_ids) > settings.incremental_max_fraction * max(loaded.index.ntotal, 1):
+        return await _full_retrain(db, job, f"{len(changed_ids) + len(removed_ids)} games changed")
+
+    job.phase = "encode"
+    vectors = await _run_cpu(game_encoder.encode, changed)
+    distance = await _run_cpu(_mean_centroid_distance, loaded.index, vectors)
+    if distance is not None and distance > settings.incremental_drift_ratio * (loaded.meta.get("centroid_distance") or 0.0):
+        return await _full_retrain(db, job, f"centroid distance drifted to {distance:.4f}")
+
+    job.phase = "add"
+    # Readers keep using the live index while the copy is patched
+    index = await _run_cpu(index_manager.writable_copy, loaded)
+    stale_ids = np.concatenate([changed_ids, removed_ids])
+    if len(stale_ids):
+        await _run_cpu(index.remove_ids, stale_ids)
+    if len(changed_ids):
+        await _run_cpu(index.add_with_ids, vectors, changed_ids)
+    ids = np.union1d(np.setdiff1d(loaded.ids, stale_ids), changed_ids)
+    job.vectors = int(index.ntotal)
+
+    job.phase = "persist"
+    meta = dict(loaded.meta, built_at=built_at.isoformat())
+    loaded = await _run_cpu(index_manager.save, index, ids, meta, vectors[:16], changed_ids[:16])
+
+    report = {
+        "mode": "incremental",
+        "version": loaded.version,
+        "vectors": int(index.ntotal),
+        "changed": len(changed_ids),
+        "removed": len(removed_ids),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info("FAISS index updated: %s", report)
+    return report
+
+
+# Index type recorded with each build
+def _index_spec() -> str:
+    return "Binary" if settings.faiss_binary else settings.faiss_index_factory
+
+
+async def _full_retrain(db: AsyncSession, job: TrainingJob, reason: str):
+    logger.info("Incremental update falls back to a full retrain: %s", reason)
+    report = await faiss_trainer(db, job)
+    report["fallback_reason"] = reason
+    return report
+
+
+# Runs faiss_trainer as a tracked background job. While a job is running,
+# new training requests get that same job back instead of starting another.
+class TrainingJobManager:
+    def __init__(self, keep_jobs: int = 20):
+        self.keep_jobs = keep_jobs
+        self._jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self._current: Optional[TrainingJob] = None
+        # Strong references, the event loop only keeps weak ones to tasks
+        self._tasks = set()
+
+    def start(self, incremental: bool = False) -> TrainingJob:
+        if self._current is not None and self._current.running:
+            return self._current
+
+        job = TrainingJob(id=uuid.uuid4().hex, mode="incremental" if incremental else "full")
+        self._current = job
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.keep_jobs:
+            self._jobs.popitem(last=False)
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: TrainingJob):
+        job.status = "running"
+        try:
+            # The job outlives the request that started it, so it opens its own session
+            async with AsyncSessionLocal() as db:
+                if job.mode == "incremental":
+                    job.report = await faiss_incremental_update(db, job)
+                else:
+                    job.report = await faiss_trainer(db, job)
+            job.status = "completed"
+        except Exception as error:
+            logger.exception("FAISS training job %s failed", job.id)
+            job.status = "failed"
+            job.error = str(error)
+        finally:
+            job.finished_at = time.time()
+
+
+training_jobs = TrainingJobManager()
@@ -0,0 +1,92 @@
+# Latency of the typeahead suggestions (app.autocomplete) on a synthetic
+# catalog, by prefix length, and a check of the suggestions against a scan of
+# every title. Needs the application settings (.env), not the database.
+#
+#   python benchmarks/bench_autocomplete.py --titles 100000 --queries 20000
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.autocomplete import TitleAutocomplete, normalize_title  # noqa: E402
+
+WORDS = ("star", "war", "dark", "souls", "legend", "quest", "space", "craft", "battle", "field", "call", "duty",
+         "king", "dom", "hearts", "final", "fantasy", "racing", "city", "sim", "tale", "zero", "hunter", "night")
+
+
+def synthetic_titles(count, rng):
+    syllables = ("ka", "ro", "mi", "tan", "vel", "dor", "shi", "qua", "zen", "bel", "cor", "fal", "gri", "hal")
+    vocabulary = list(WORDS) + ["".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(5000)]
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(vocabulary))]
+    titles = []
+    for _ in range(count):
+        title = " ".join(rng.choices(vocabulary, weights, k=rng.randint(1, 4))).title()
+        if rng.random() < 0.2:
+            title += f": {rng.choice(WORDS).title()} {rng.randint(2, 5)}"
+        titles.append(title)
+    return titles
+
+
+# Suggestions of a scan: titles with a word starting the normalized prefix
+def scan(titles, text, top_n):
+    prefix = normalize_title(text)
+    found = []
+    for position, title in enumerate(titles):
+        words = normalize_title(title).split()
+        if any(" ".join(words[start:]).startswith(prefix) for start in range(len(words))):
+            found.append(position)
+            if len(found) == top_n:
+                break
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--titles", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--checks", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    # Ids in popularity order, like the rows refresh() reads
+    titles = synthetic_titles(args.titles, rng)
+    autocomplete = TitleAutocomplete(top_n=args.top_n)
+    started = time.perf_counter()
+    autocomplete.build(list(enumerate(titles)))
+    print(f"{len(titles)} titles, {len(autocomplete.snapshot.keys)} keys, {len(autocomplete.snapshot.table)} precomputed prefixes, "
+          f"build {time.perf_counter() - started:.2f} s")
+
+    by_length = {}
+    for _ in range(args.queries):
+        words = normalize_title(rng.choice(titles)).split()
+        start = rng.randrange(len(words))
+        key = " ".join(words[start:])
+        length = rng.choice((1, 2, 3, 4, 6, 10))
+        by_length.setdefault(min(length, len(key)), []).append(key[:length])
+
+    for length in sorted(by_length):
+        prefixes = by_length[length]
+        latencies = np.empty(len(prefixes))
+        for row, prefix in enumerate(prefixes):
+            started = time.perf_counter()
+            autocomplete.suggest(prefix)
+            latencies[row] = time.perf_counter() - started
+        latencies *= 1000
+        print(f"prefix length {length:>2}  {len(prefixes):6d} queries   p50 {np.percentile(latencies, 50):7.4f} ms   "
+              f"p99 {np.percentile(latencies, 99):7.4f} ms   max {latencies.max():7.3f} ms")
+
+    prefixes = [prefix for group in by_length.values() for prefix in group]
+    mismatches = 0
+    for prefix in rng.sample(prefixes, min(args.checks, len(prefixes))):
+        if [game_id for game_id, _ in autocomplete.suggest(prefix)] != scan(titles, prefix, args.top_n):
+            mismatches += 1
+    print(f"{min(args.checks, len(prefixes))} prefixes checked against a scan, {mismatches} mismatches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Float32 FAISS indexes versus the bit-packed BinaryGameIndex (settings.faiss_binary):
+# index size, single-query QPS and recall@k against exact float search.
+#
+#   python benchmarks/bench_binary.py --games 67000
+#
+# Recall counts a result as correct when its exact distance is within the
+# true k-th distance, so ties between identical games are not held against
+# either index.
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bench_encoder import synthetic_catalog  # noqa: E402
+from app import utils  # noqa: E402
+from app.binary_index import BinaryGameIndex  # noqa: E402
+from app.encoder import GameEncoder  # noqa: E402
+
+
+def measure(index, queries, k):
+    distances = np.empty((len(queries), k), dtype=np.float32)
+    started = time.perf_counter()
+    for row, query in enumerate(queries):
+        distances[row:row + 1], _ = index.search(query[None, :], k)
+    return distances, len(queries) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=67000)
+    parser.add_argument("--nlist", type=int, default=670)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    encoder = GameEncoder(utils.genres, utils.game_engines, utils.award_categories)
+    vectors = encoder.encode(synthetic_catalog(args.games))
+    ids = np.arange(len(vectors), dtype=np.int64)
+    queries = vectors[np.random.default_rng(0).choice(len(vectors), args.queries, replace=False)]
+
+    exact = faiss.IndexFlatL2(encoder.dimension)
+    exact.add(vectors)
+    truth, _ = exact.search(queries, args.k)
+
+    candidates = []
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(encoder.dimension), encoder.dimension, args.nlist)
+    ivf.train(vectors)
+    ivf.add_with_ids(vectors, ids)
+    ivf.nprobe = 100
+    candidates.append(("float Flat", exact, faiss.serialize_index(exact).nbytes))
+    candidates.append((f"float IVF{args.nlist} nprobe=100", ivf, faiss.serialize_index(ivf).nbytes))
+    for nlist, rating_bits, rerank_factor in [(0, 3, 16), (0, 3, 4), (0, 7, 16), (args.nlist, 3, 16)]:
+        binary = BinaryGameIndex(encoder, nlist, rating_bits, rerank_factor)
+        if not binary.is_trained:
+            binary.train(vectors)
+        binary.add_with_ids(vectors, ids)
+        binary.nprobe = 100
+        # Flat indexes hold the codes in place, BIVF next to a sorted copy
+        index_bytes = faiss.serialize_index_binary(binary.index).nbytes if nlist else 0
+        size = index_bytes + binary.codes.nbytes + binary.ratings.nbytes + binary.primary_genres.nbytes + binary.ids.nbytes
+        name = f"binary {'BIVF%d nprobe=100' % nlist if nlist else 'flat'} bits={rating_bits} x{rerank_factor}"
+        candidates.append((name, binary, size))
+
+    print(f"catalog: {len(vectors)} games, {args.queries} queries, k={args.k}, single thread")
+    print(f"{'index':<40} {'size MiB':>9} {'bytes/game':>11} {'QPS':>8} {'recall':>7}")
+    for name, index, size in candidates:
+        distances, qps = measure(index, queries, args.k)
+        recall = float(np.mean(distances <= truth[:, -1:] + 1e-5))
+        print(f"{name:<40} {size / 2 ** 20:>9.2f} {size / len(vectors):>11.1f} {qps:>8.0f} {recall:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
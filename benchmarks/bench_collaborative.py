@@ -0,0 +1,107 @@
+# Build time, size and per-user scoring latency of the item-item
+# co-occurrence model (app.cooccurrence) on a synthetic review history.
+#
+#   python benchmarks/bench_collaborative.py --reviews 1000000 --users 100000
+#
+# Game popularity follows a Zipf law and every user likes games from a
+# couple of genres, so co-liked pairs cluster like real ones. Scoring is
+# measured with an empty delta set, then again after --deltas live reviews
+# were applied without merging, and the merge itself is timed.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.cooccurrence import CooccurrenceModel  # noqa: E402
+
+
+def synthetic_reviews(n_reviews, n_users, n_games, n_genres, rng):
+    genres = rng.integers(0, n_genres, n_games)
+    by_genre = [np.flatnonzero(genres == genre) for genre in range(n_genres)]
+    # Within a genre, popularity falls off as a Zipf law
+    popularity = [1 / np.arange(1, len(games) + 1) ** 0.8 for games in by_genre]
+    popularity = [weights / weights.sum() for weights in popularity]
+
+    # Review counts per user are skewed too, a few users review a lot
+    per_user = rng.zipf(1.6, n_users).clip(1, 2000)
+    per_user = np.maximum(1, (per_user * n_reviews / per_user.sum()).astype(int))
+    users, games = [], []
+    for user, count in enumerate(per_user):
+        tastes = rng.choice(n_genres, 2, replace=False)
+        picked = rng.choice(tastes, count)
+        for genre in tastes:
+            n = int((picked == genre).sum())
+            if n:
+                users.append(np.full(n, user))
+                games.append(rng.choice(by_genre[genre], n, p=popularity[genre]))
+    return np.concatenate(users), np.concatenate(games)
+
+
+def measure_scoring(model, seeds):
+    latencies = np.empty(len(seeds))
+    for row, (game_ids, weights) in enumerate(seeds):
+        started = time.perf_counter()
+        model.score(game_ids, weights)
+        latencies[row] = time.perf_counter() - started
+    return latencies * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviews", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--games", type=int, default=67_000)
+    parser.add_argument("--genres", type=int, default=24)
+    parser.add_argument("--max-user-items", type=int, default=500)
+    parser.add_argument("--top-n", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--deltas", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    users, games = synthetic_reviews(args.reviews, args.users, args.games, args.genres, rng)
+    print(f"reviews: {len(users)}, users: {len(np.unique(users))}, games: {len(np.unique(games))}")
+
+    started = time.perf_counter()
+    model = CooccurrenceModel.build(users, games, args.max_user_items, args.top_n)
+    build_seconds = time.perf_counter() - started
+    matrix = model.matrix
+    size = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes + model.ids.nbytes + model.counts.nbytes
+    print(f"build: {build_seconds:.2f} s, {matrix.nnz} pairs, {size / 2 ** 20:.1f} MiB")
+
+    # Seed sets like the ones of a prediction: a user's liked games
+    order = np.argsort(users, kind="stable")
+    starts = np.searchsorted(users[order], np.arange(users.max() + 2))
+    sampled = rng.choice(users.max() + 1, args.queries, replace=False)
+    seeds = []
+    for user in sampled:
+        liked = np.unique(games[order[starts[user]:starts[user + 1]]])
+        seeds.append((liked, rng.uniform(8, 10, len(liked)).astype(np.float32)))
+    sizes = np.array([len(liked) for liked, _ in seeds])
+    print(f"seed games per user: median {np.median(sizes):.0f}, max {sizes.max()}")
+
+    def report(label, latencies):
+        print(f"{label:<28} p50 {np.percentile(latencies, 50):7.3f} ms   p99 {np.percentile(latencies, 99):7.3f} ms")
+
+    report("score", measure_scoring(model, seeds))
+
+    started = time.perf_counter()
+    for _ in range(args.deltas):
+        user = int(rng.integers(0, users.max() + 1))
+        liked = games[order[starts[user]:starts[user + 1]]]
+        model.add_interaction(int(rng.integers(0, args.games)), liked.tolist())
+    delta_ms = (time.perf_counter() - started) * 1000 / args.deltas
+    print(f"{'apply a review':<28} mean {delta_ms:7.3f} ms ({model.pending_pairs} pending pairs)")
+    report(f"score with {args.deltas} deltas", measure_scoring(model, seeds))
+
+    started = time.perf_counter()
+    model.merge()
+    print(f"{'merge':<28} {(time.perf_counter() - started) * 1000:9.1f} ms, {model.matrix.nnz} pairs")
+    report("score after merge", measure_scoring(model, seeds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Whole-catalog encoding time: the original per-game encoder + np.vstack
+# versus GameEncoder.encode, parsing the strings or reading precomputed
+# feature_bits, and a comparison of the outputs. The original encoder never
+# matched an engine (it iterated the technologies string character by
+# character), its engines block is only compared by the count of set entries.
+#
+#   python benchmarks/bench_encoder.py --games 67000
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app import utils  # noqa: E402
+from app.encoder import GameEncoder  # noqa: E402
+
+
+# The encoder used by crud before the batch encoder, kept here as reference
+def create_numpy_array_for_game(game, genres_mapping, game_engines_mapping, award_categories_mapping):
+    rating = float(game.steam_rating) * 0.008
+
+    genres_array = np.zeros(len(genres_mapping))
+    for genre in game.genres.split(','):
+        if genre in genres_mapping:
+            genres_array[genres_mapping[genre]] = 1
+
+    primary_genres_array = np.zeros(len(genres_mapping))
+    if game.primary_genre in genres_mapping:
+        primary_genres_array[genres_mapping[game.primary_genre]] = 0.1
+
+    game_engines_array = np.zeros(len(game_engines_mapping))
+    for engine in game.detected_technologies:
+        if engine in game_engines_mapping:
+            game_engines_array[game_engines_mapping[engine]] = 1
+
+    award_categories_array = np.zeros(len(award_categories_mapping))
+    for award in game.award_names:
+        if award in award_categories_mapping:
+            award_categories_array[award_categories_mapping[award]] = 1
+
+    return np.concatenate([
+        [rating],
+        primary_genres_array,
+        genres_array,
+        game_engines_array,
+        award_categories_array
+    ])
+
+
+def synthetic_catalog(n_games):
+    # Catalog strings repeat heavily (Steam lists genres in a fixed order), so
+    # genres and technologies are drawn from pools of common combinations
+    rng = random.Random(0)
+    genre_pool = [",".join(sorted(rng.sample(utils.genres, rng.randint(1, 4)))) for _ in range(3000)]
+    technology_pool = [",".join("Engine." + engine for engine in rng.sample(utils.game_engines, rng.randint(0, 2))) for _ in range(500)]
+    games = []
+    for _ in range(n_games):
+        genres = rng.choice(genre_pool)
+        games.append(SimpleNamespace(
+            steam_rating=round(rng.uniform(20, 99), 2),
+            primary_genre=rng.choice(genres.split(",") + ["Unknown"]),
+            genres=genres,
+            detected_technologies=rng.choice(technology_pool),
+            award_names=set(rng.sample(utils.award_categories, rng.choice([0, 0, 0, 1, 2]))),
+        ))
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=67000)
+    args = parser.parse_args()
+
+    games = synthetic_catalog(args.games)
+
+    start = time.perf_counter()
+    genres_mapping = {genre: index for index, genre in enumerate(utils.genres)}
+    game_engines_mapping = {engine: index for index, engine in enumerate(utils.game_engines)}
+    award_categories_mapping = {category: index for index, category in enumerate(utils.award_categories)}
+    legacy = np.array([
+        create_numpy_array_for_game(game, genres_mapping, game_engines_mapping, award_categories_mapping).flatten()
+        for game in games
+    ]).astype('float32')
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoder = GameEncoder(utils.genres, utils.game_engines, utils.award_categories)
+    batch = encoder.encode(games)
+    batch_time = time.perf_counter() - start
+
+    for game in games:
+        game.feature_bits = encoder.feature_bits(game.genres, game.detected_technologies)
+    start = time.perf_counter()
+    precomputed = encoder.encode(games)
+    precomputed_time = time.perf_counter() - start
+
+    engines = np.zeros(batch.shape[1], dtype=bool)
+    engines[encoder.game_engines_offset:encoder.award_categories_offset] = True
+    print(f"games: {args.games}, dimension: {batch.shape[1]}")
+    print(f"{'per-game encoder':>24}: {legacy_time * 1000:9.1f} ms")
+    print(f"{'batch encoder':>24}: {batch_time * 1000:9.1f} ms")
+    print(f"{'batch + feature_bits':>24}: {precomputed_time * 1000:9.1f} ms")
+    print(f"{'identical but engines':>24}: {np.array_equal(legacy[:, ~engines], batch[:, ~engines])}")
+    print(f"{'engines set':>24}: per-game {int(legacy[:, engines].sum())}, batch {int(batch[:, engines].sum())}")
+    print(f"{'feature_bits identical':>24}: {precomputed.tobytes() == batch.tobytes()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Latency of /games/browse filters on the in-memory facet bitmaps
+# (app.facets) for random filter combinations over a synthetic catalog, and a
+# check of the matches and counts against a scan of every game. Needs the
+# application settings (.env), not the database.
+#
+#   python benchmarks/bench_facets.py --games 100000 --queries 2000
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app import utils  # noqa: E402
+from app.encoder import game_encoder, split_values, ENGINE_PREFIX  # noqa: E402
+from app.facets import FACETS, FacetIndex  # noqa: E402
+
+
+def synthetic_catalog(count, rng):
+    genres, engines = utils.genres, utils.game_engines
+    genre_weights = [1 / (rank + 1) for rank in range(len(genres))]
+    engine_weights = [1 / (rank + 1) ** 1.5 for rank in range(len(engines))]
+    games, awards = [], []
+    for game_id in range(count):
+        game_genres = ",".join(set(rng.choices(genres, genre_weights, k=rng.randint(1, 4))))
+        technologies = ";".join(ENGINE_PREFIX + engine for engine in rng.choices(engines, engine_weights, k=rng.randint(0, 2)))
+        rating = round(rng.triangular(20, 100, 75), 2) if rng.random() < 0.98 else None
+        games.append((game_id, rating, game_genres, technologies, None))
+        if rng.random() < 0.02:
+            awards.append((game_id, rng.choice(utils.award_categories)))
+    # Best rated first, as FacetIndex.refresh reads them
+    games.sort(key=lambda game: (game[1] is None, -(game[1] or 0), game[0]))
+    return games, awards
+
+
+def random_filters(index, rng):
+    filters = {}
+    for facet in FACETS:
+        if rng.random() < 0.5:
+            filters[facet] = rng.sample(index.values[facet], rng.randint(1, 3))
+    return filters
+
+
+# Matches and counts of a scan of every game
+def scan(games, awards, filters, bucket):
+    award_names = {}
+    for game_id, name in awards:
+        award_names.setdefault(game_id, set()).add(name)
+    facet_values = []
+    for game_id, rating, genres, technologies, _ in games:
+        engines = {value[len(ENGINE_PREFIX):] for value in split_values(technologies) if value.startswith(ENGINE_PREFIX)}
+        rating_value = set()
+        if rating is not None:
+            start = min(int(rating // bucket) * bucket, 100 - bucket)
+            rating_value = {f"{start}-{start + bucket}"}
+        facet_values.append((game_id, {"genre": set(split_values(genres)) & set(utils.genres),
+                                       "engine": engines & set(utils.game_engines),
+                                       "award": award_names.get(game_id, set()), "rating": rating_value}))
+
+    def keeps(values, skip=None):
+        return all(values[facet] & set(accepted) for facet, accepted in filters.items() if facet != skip)
+
+    matches = [game_id for game_id, values in facet_values if keeps(values)]
+    counts = {}
+    for facet in FACETS:
+        counts[facet] = {}
+        for _, values in facet_values:
+            if keeps(values, facet):
+                for value in values[facet]:
+                    counts[facet][value] = counts[facet].get(value, 0) + 1
+    return matches, counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--checks", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    games, awards = synthetic_catalog(args.games, rng)
+    index = FacetIndex(game_encoder, utils.award_categories)
+    started = time.perf_counter()
+    index.build(games, awards)
+    size = sum(bitmaps.nbytes for bitmaps in index.snapshot.bitmaps.values())
+    print(f"{len(games)} games, {sum(map(len, index.values.values()))} bitmaps, {size / 2 ** 20:.1f} MiB, "
+          f"build {time.perf_counter() - started:.2f} s")
+
+    queries = [random_filters(index, rng) for _ in range(args.queries)]
+    latencies = np.empty(len(queries))
+    for row, filters in enumerate(queries):
+        started = time.perf_counter()
+        index.search(filters, rng.choice((0, 0, 100)), args.limit)
+        latencies[row] = time.perf_counter() - started
+    latencies *= 1000
+    print(f"search + counts   p50 {np.percentile(latencies, 50):7.3f} ms   p99 {np.percentile(latencies, 99):7.3f} ms   "
+          f"max {latencies.max():7.3f} ms")
+
+    mismatches = 0
+    for filters in queries[:args.checks]:
+        page, total, counts = index.search(filters, 0, args.limit)
+        matches, expected_counts = scan(games, awards, filters, index.rating_bucket)
+        if page != matches[:args.limit] or total != len(matches) or counts != expected_counts:
+            mismatches += 1
+    print(f"{args.checks} filter combinations checked against a scan, {mismatches} mismatches")
+
+
+if __name__ == "__main__":
+    main()
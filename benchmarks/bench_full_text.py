@@ -0,0 +1,90 @@
+# Latency and result quality of the full-text search (games.search_vector,
+# crud.search_games_full_text) against the ILIKE plus Levenshtein title
+# search run by the database (crud.search_games_by_similar_title without the
+# in-memory index). Needs the application settings (.env), and the database
+# with migrations/004_games_search_vector.sql applied.
+#
+#   python benchmarks/bench_full_text.py --queries 300
+#
+# Each query is built from a random game: its whole title, two of its title
+# words, or title words plus its developer. Quality is the share of queries
+# whose game is in the first 10 results (hit@10) and the mean reciprocal rank
+# of that game.
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sqlalchemy import select  # noqa: E402
+
+from app import crud, models  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+
+KINDS = ("title", "title words", "words + developer")
+
+
+def make_query(game, kind, rng):
+    words = game.title.split()
+    if kind == "title":
+        return game.title
+    picked = " ".join(rng.sample(words, min(2, len(words))))
+    if kind == "title words":
+        return picked
+    return f"{picked} {game.developer}"
+
+
+async def run(search, queries):
+    latencies, ranks = [], []
+    for game_id, query in queries:
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            found = await search(db, query)
+            latencies.append(time.perf_counter() - started)
+        ids = [game.id for game in found]
+        ranks.append(ids.index(game_id) + 1 if game_id in ids else None)
+    return np.array(latencies) * 1000, ranks
+
+
+def report(label, latencies, ranks):
+    hits = [rank for rank in ranks if rank is not None]
+    mrr = sum(1 / rank for rank in hits) / len(ranks)
+    print(f"  {label:<12} p50 {np.percentile(latencies, 50):8.2f} ms   p99 {np.percentile(latencies, 99):8.2f} ms   "
+          f"hit@10 {len(hits) / len(ranks):6.1%}   MRR {mrr:.3f}")
+
+
+async def main():
+    # The engine logs every statement
+    async_engine.echo = False
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    # The database path of the title search, not the in-memory index
+    settings.title_search_index = False
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(models.Game.id, models.Game.title, models.Game.developer))
+        games = [game for game in result.all() if game.title and game.developer]
+
+    async def fuzzy(db, query):
+        return await crud.search_games_by_similar_title(db, query, limit=10)
+
+    async def full_text(db, query):
+        return (await crud.search_games_full_text(db, query, limit=10)).games
+
+    for kind in KINDS:
+        sampled = rng.sample(games, args.queries)
+        queries = [(game.id, make_query(game, kind, rng)) for game in sampled]
+        print(f"{kind} ({len(queries)} queries, e.g. {queries[0][1]!r})")
+        report("ilike", *await run(fuzzy, queries))
+        report("full text", *await run(full_text, queries))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+# Prediction latency with the FAISS index read from disk on every request
+# (previous behaviour) versus a resident index loaded once per process.
+#
+#   python benchmarks/bench_index_load.py --games 67000 --requests 50
+#
+# A synthetic IVF index with the same dimension and nlist as faiss_trainer is
+# built in a temporary directory, so no database is needed.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app import utils  # noqa: E402
+
+DIMENSION = 1 + 2 * len(utils.genres) + len(utils.game_engines) + len(utils.award_categories)
+
+
+def build_index(path, n_games, nlist):
+    rng = np.random.default_rng(0)
+    vectors = (rng.random((n_games, DIMENSION)) > 0.9).astype("float32")
+    vectors[:, 0] = rng.random(n_games) * 0.8
+    quantizer = faiss.IndexFlatL2(DIMENSION)
+    index = faiss.IndexIVFFlat(quantizer, DIMENSION, nlist, faiss.METRIC_L2)
+    index.train(vectors)
+    index.add(vectors)
+    faiss.write_index(index, path)
+    return vectors
+
+
+def percentile(samples, p):
+    return float(np.percentile(np.array(samples) * 1000, p))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=67000)
+    parser.add_argument("--nlist", type=int, default=670)
+    parser.add_argument("--nprobe", type=int, default=100)
+    parser.add_argument("--seeds", type=int, default=30)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "games.index")
+        vectors = build_index(path, args.games, args.nlist)
+        print(f"index: {args.games} vectors, {os.path.getsize(path) / 2**20:.1f} MiB on disk")
+        rng = np.random.default_rng(1)
+
+        def queries():
+            return vectors[rng.integers(0, len(vectors), args.seeds)]
+
+        per_request = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            index = faiss.read_index(path)
+            index.nprobe = args.nprobe
+            index.search(queries(), args.k)
+            per_request.append(time.perf_counter() - start)
+
+        resident_index = faiss.read_index(path)
+        resident_index.nprobe = args.nprobe
+        resident = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            resident_index.search(queries(), args.k)
+            resident.append(time.perf_counter() - start)
+
+    for name, samples in (("read per request", per_request), ("resident", resident)):
+        print(f"{name:>18}: p50 {percentile(samples, 50):8.2f} ms   p99 {percentile(samples, 99):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Build time, size, QPS and recall@k of candidate FAISS index types for the
+# recommender, against exact IndexFlatL2 search on the same vectors.
+#
+#   python benchmarks/bench_index_types.py --games 67000 --report report.json
+#   python benchmarks/bench_index_types.py --from-database --report report.json
+#
+# A configuration is a faiss.index_factory spec (as settings.faiss_index_factory,
+# {nlist} included) and the faiss.ParameterSpace strings to search it with (as
+# settings.faiss_search_params). Queries are catalog vectors, like the seeds of
+# a prediction, searched one at a time on a single thread as a request does.
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bench_encoder import synthetic_catalog  # noqa: E402
+from app import utils  # noqa: E402
+from app.encoder import GameEncoder  # noqa: E402
+
+CONFIGURATIONS = [
+    ("Flat", [""]),
+    ("IVF{nlist},Flat", ["nprobe=10", "nprobe=50", "nprobe=100"]),
+    ("IVF{nlist},PQ23", ["nprobe=10", "nprobe=50", "nprobe=100"]),
+    ("IVF{nlist},PQ46", ["nprobe=50"]),
+    ("HNSW32", ["efSearch=32", "efSearch=64", "efSearch=128"]),
+]
+
+
+def catalog_vectors(args):
+    if args.from_database:
+        # Needs the application settings (.env) and the database
+        import asyncio
+        from app import crud
+        from app.database import AsyncSessionLocal
+        from app.encoder import game_encoder
+
+        async def load():
+            chunks = []
+            async with AsyncSessionLocal() as db:
+                async for rows in crud.stream_games_with_awards(db, 5000):
+                    chunks.append(game_encoder.encode(rows))
+            return np.concatenate(chunks)
+
+        return asyncio.run(load())
+
+    encoder = GameEncoder(utils.genres, utils.game_engines, utils.award_categories)
+    return encoder.encode(synthetic_catalog(args.games))
+
+
+def create_index(spec, dimension, nlist):
+    # Same wrapping as app.faiss_index.create_index
+    index = faiss.index_factory(dimension, spec.format(nlist=nlist), faiss.METRIC_L2)
+    try:
+        faiss.extract_index_ivf(index)
+    except RuntimeError:
+        index = faiss.index_factory(dimension, "IDMap," + spec.format(nlist=nlist), faiss.METRIC_L2)
+    return index
+
+
+def measure_search(index, queries, k, params):
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for row, query in enumerate(queries):
+        started = time.perf_counter()
+        _, labels[row:row + 1] = index.search(query[None, :], k)
+        latencies[row] = time.perf_counter() - started
+    return labels, latencies
+
+
+def recall_at_k(labels, truth):
+    hits = sum(len(np.intersect1d(found[found >= 0], expected)) for found, expected in zip(labels, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=67000)
+    parser.add_argument("--from-database", action="store_true", help="encode the real catalog instead of a synthetic one")
+    parser.add_argument("--nlist", type=int, default=670)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--spec", action="append", help="index_factory spec to test instead of the defaults")
+    parser.add_argument("--params", action="append", help="ParameterSpace string for the --spec given before it")
+    parser.add_argument("--report", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    configurations = CONFIGURATIONS
+    if args.spec:
+        params = args.params or []
+        configurations = [(spec, [params[i] if i < len(params) else ""]) for i, spec in enumerate(args.spec)]
+
+    faiss.omp_set_num_threads(1)
+    vectors = catalog_vectors(args)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    nlist = min(args.nlist, len(vectors))
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"catalog: {len(vectors)} vectors, dimension {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<18} {'params':<14} {'build s':>8} {'size MiB':>9} {'QPS':>8} {'p50 ms':>7} {'p99 ms':>7} {'recall':>7}")
+    results = []
+    for spec, params_list in configurations:
+        index = create_index(spec, vectors.shape[1], nlist)
+        # Training is multi-threaded in production too
+        faiss.omp_set_num_threads(os.cpu_count() or 1)
+        started = time.perf_counter()
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        build_seconds = time.perf_counter() - started
+        faiss.omp_set_num_threads(1)
+        size = faiss.serialize_index(index).nbytes
+
+        for params in params_list:
+            labels, latencies = measure_search(index, queries, args.k, params)
+            result = {
+                "index_factory": spec,
+                "search_params": params,
+                "build_seconds": round(build_seconds, 3),
+                "size_mib": round(size / 2 ** 20, 2),
+                "qps": round(len(queries) / latencies.sum(), 1),
+                "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+                f"recall_at_{args.k}": round(recall_at_k(labels, truth), 4),
+            }
+            results.append(result)
+            print(f"{spec.format(nlist=nlist):<18} {params or '-':<14} {result['build_seconds']:>8.2f} "
+                  f"{result['size_mib']:>9.2f} {result['qps']:>8.0f} {result['p50_ms']:>7.3f} "
+                  f"{result['p99_ms']:>7.3f} {result[f'recall_at_{args.k}']:>7.3f}")
+
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump({
+                "vectors": len(vectors),
+                "dimension": int(vectors.shape[1]),
+                "queries": len(queries),
+                "k": args.k,
+                "source": "database" if args.from_database else "synthetic",
+                "results": results,
+            }, report_file, indent=2)
+        print(f"report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Throughput and latency of the read endpoints under concurrent clients. Sync
+# endpoints run in Starlette's threadpool (40 threads) and cap there: past it,
+# requests queue for a thread, and the threads waiting for a database
+# connection hold the ones closing sessions back. Async endpoints wait on the
+# database pool only.
+#
+#   python benchmarks/bench_load.py --url http://localhost:8000 --concurrency 10 40 80 160
+#
+# Without --url the application is served in-process through httpx's ASGI
+# transport, which needs the application settings (.env) and its database.
+# Clients and application then share one event loop and CPU: the shape of the
+# curve holds, absolute numbers need a server.
+# Every client loops over random games (by id and by exact title) and users
+# (followers and following) for --duration seconds.
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+async def sample_paths(client, games, rng):
+    paths = []
+    for game_id in rng.sample(range(1, games + 1), min(200, games)):
+        paths.append(f"/{game_id}")
+        response = await client.get(f"/{game_id}")
+        if response.status_code == 200:
+            paths.append(f"/title/{response.json()['title']}")
+    response = await client.get("/users")
+    if response.status_code == 200:
+        paths.extend(f"/users/{user['nickname']}/followers&Following" for user in response.json())
+    return paths
+
+
+async def client_loop(client, paths, deadline, rng, latencies, errors):
+    while time.perf_counter() < deadline:
+        path = rng.choice(paths)
+        started = time.perf_counter()
+        response = await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            errors.append(response.status_code)
+
+
+async def run(client, paths, concurrency, duration, rng):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(client, paths, deadline, random.Random(rng.random()), latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    print(f"{concurrency:>11} {len(latencies) / elapsed:>9.0f} {np.percentile(latencies, 50):>8.2f} "
+          f"{np.percentile(latencies, 99):>8.2f} {len(errors):>7}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="running server, the application is served in-process when omitted")
+    parser.add_argument("--games", type=int, default=5000, help="game ids are sampled from 1..games")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 40, 80, 160])
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.url:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max(args.concurrency)))
+        base_url = args.url
+    else:
+        from app.main import app
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        base_url = "http://bench"
+
+    rng = random.Random(1)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+        paths = await sample_paths(client, args.games, rng)
+        print(f"{len(paths)} paths")
+        print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for concurrency in args.concurrency:
+            await run(client, paths, concurrency, args.duration, rng)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
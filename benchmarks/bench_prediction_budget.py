@@ -0,0 +1,73 @@
+# Latency of uncached predictions for every user of the database, with the
+# stage budgets of the settings (or --budgets) and with every budget disabled,
+# plus the share of partial responses. Needs the application settings (.env)
+# and the database, and a trained index.
+#
+#   python benchmarks/bench_prediction_budget.py --k 20 --users 200 --budgets 0.3 0.3 0.3 0.2
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sqlalchemy import select  # noqa: E402
+
+from app import crud, models  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.popular import popular_games  # noqa: E402
+
+BUDGETS = ("prediction_seeds_budget", "prediction_expansion_budget",
+           "prediction_search_budget", "prediction_hydration_budget")
+
+
+async def measure(nicknames, k):
+    latencies, partial = [], 0
+    for nickname in nicknames:
+        crud.recommendation_cache.clear()
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            _, was_partial = await crud.get_games_predictions(db, nickname, k)
+            latencies.append(time.perf_counter() - started)
+        partial += was_partial
+    return np.array(latencies) * 1000, partial
+
+
+async def main():
+    # The engine logs every statement
+    async_engine.echo = False
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200, help="users with the most reviews first")
+    parser.add_argument("--budgets", type=float, nargs=4, metavar=("SEEDS", "EXPANSION", "SEARCH", "HYDRATION"),
+                        help="stage budgets in seconds, the settings when omitted")
+    args = parser.parse_args()
+
+    async with AsyncSessionLocal() as db:
+        await popular_games.refresh(db)
+        result = await db.execute(
+            select(models.Review.user_nickname)
+            .group_by(models.Review.user_nickname)
+            .order_by(crud.func.count().desc())
+            .limit(args.users)
+        )
+        nicknames = result.scalars().all()
+
+    if args.budgets:
+        configured = dict(zip(BUDGETS, args.budgets))
+    else:
+        configured = {name: getattr(settings, name) for name in BUDGETS}
+    print(f"{len(nicknames)} users, k={args.k}, budgets: {configured}")
+    for label, budgets in [("budgets", configured), ("unbounded", dict.fromkeys(BUDGETS, 0))]:
+        for name, value in budgets.items():
+            setattr(settings, name, value)
+        latencies, partial = await measure(nicknames, args.k)
+        print(f"{label:<10} p50 {np.percentile(latencies, 50):8.1f} ms   p99 {np.percentile(latencies, 99):8.1f} ms   "
+              f"max {latencies.max():8.1f} ms   partial {partial / len(nicknames):6.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
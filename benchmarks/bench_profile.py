@@ -0,0 +1,85 @@
+# Recommendation search with one FAISS query per seed game (previous
+# behaviour) versus the seeds collapsed into a few weighted k-means taste
+# vectors (app.profile), for users with more and more seed games.
+#
+#   python benchmarks/bench_profile.py --games 67000 --seeds 10 50 200 500
+#
+# Overlap is the share of the per-seed candidate ids that the profile search
+# also returns. Latency includes the clustering.
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bench_encoder import synthetic_catalog  # noqa: E402
+from app import utils  # noqa: E402
+from app.encoder import GameEncoder  # noqa: E402
+from app.profile import build_query_vectors, neighbours_per_query  # noqa: E402
+
+
+def user_seeds(vectors, rng, n_seeds, tastes=3):
+    # A user likes a few kinds of games: seeds are drawn close to a handful
+    # of catalog games, like reviews plus their similar titles
+    anchors = vectors[rng.choice(len(vectors), tastes, replace=False)]
+    distances = ((vectors[:, None, :] - anchors[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+    nearest = np.argsort(distances)[:n_seeds * 4]
+    return vectors[rng.choice(nearest, n_seeds, replace=False)], rng.uniform(8, 10, n_seeds).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=67000)
+    parser.add_argument("--nlist", type=int, default=670)
+    parser.add_argument("--nprobe", type=int, default=100)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--max-queries", type=int, default=8)
+    parser.add_argument("--max-neighbours", type=int, default=1000)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    encoder = GameEncoder(utils.genres, utils.game_engines, utils.award_categories)
+    vectors = encoder.encode(synthetic_catalog(args.games))
+    quantizer = faiss.IndexFlatL2(encoder.dimension)
+    index = faiss.IndexIVFFlat(quantizer, encoder.dimension, args.nlist, faiss.METRIC_L2)
+    index.train(vectors)
+    index.add(vectors)
+    index.nprobe = args.nprobe
+    faiss.omp_set_num_threads(1)
+    print(f"index: {args.games} vectors, k={args.k}, max queries={args.max_queries}")
+    print(f"{'seeds':>6} {'queries':>8} {'per-seed ms':>12} {'profile ms':>11} {'per-seed ids':>13} {'profile ids':>12} {'overlap':>8}")
+
+    rng = np.random.default_rng(0)
+    for n_seeds in args.seeds:
+        per_seed_times, profile_times, overlaps, per_seed_sizes, profile_sizes, query_counts = [], [], [], [], [], []
+        for _ in range(args.users):
+            seeds, weights = user_seeds(vectors, rng, n_seeds)
+
+            start = time.perf_counter()
+            _, labels = index.search(seeds, args.k)
+            per_seed = np.unique(labels[labels >= 0])
+            per_seed_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            queries = build_query_vectors(seeds, weights, args.max_queries)
+            neighbours = neighbours_per_query(args.k, len(seeds), len(queries), args.max_neighbours)
+            _, labels = index.search(queries, neighbours)
+            profile = np.unique(labels[labels >= 0])
+            profile_times.append(time.perf_counter() - start)
+
+            query_counts.append(len(queries))
+            per_seed_sizes.append(len(per_seed))
+            profile_sizes.append(len(profile))
+            overlaps.append(len(np.intersect1d(per_seed, profile)) / max(len(per_seed), 1))
+
+        print(f"{n_seeds:>6} {np.mean(query_counts):>8.1f} {np.median(per_seed_times) * 1000:>12.2f} "
+              f"{np.median(profile_times) * 1000:>11.2f} {np.mean(per_seed_sizes):>13.0f} "
+              f"{np.mean(profile_sizes):>12.0f} {np.mean(overlaps):>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
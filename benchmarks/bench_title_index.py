@@ -0,0 +1,118 @@
+# Latency of the fuzzy title search through the in-memory trigram index
+# (app.title_index) against the Levenshtein scan of the games table, and
+# whether both return the same matches. Needs the application settings (.env)
+# and the database.
+#
+#   python benchmarks/bench_title_index.py --queries 300 --copies 10
+#
+# Queries are whole titles, single words, two-word fragments and truncated or
+# misspelt words taken from the catalog. --copies repeats every title with a
+# suffix to time the index alone on a larger catalog.
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sqlalchemy import select  # noqa: E402
+
+from app import crud, models  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.title_index import TitleIndex  # noqa: E402
+
+
+def sample_queries(titles, count, rng):
+    queries = []
+    while len(queries) < count:
+        words = rng.choice(titles).split()
+        if not words:
+            continue
+        kind = len(queries) % 4
+        if kind == 0:
+            queries.append(" ".join(words))
+        elif kind == 1:
+            queries.append(rng.choice(words))
+        elif kind == 2:
+            start = rng.randrange(len(words))
+            queries.append(" ".join(words[start:start + 2]))
+        else:
+            word = rng.choice(words)
+            if len(word) > 4 and rng.random() < 0.5:
+                position = rng.randrange(len(word))
+                word = word[:position] + "x" + word[position + 1:]
+            queries.append(word[:max(2, len(word) - 2)])
+    return queries
+
+
+def report(label, latencies):
+    latencies = np.asarray(latencies) * 1000
+    print(f"{label:<24} p50 {np.percentile(latencies, 50):8.3f} ms   p99 {np.percentile(latencies, 99):8.3f} ms")
+
+
+async def main():
+    # The engine logs every statement
+    async_engine.echo = False
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--max-distance", type=int, default=40)
+    parser.add_argument("--copies", type=int, default=10)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(models.Game.id, models.Game.title))
+        rows = result.all()
+    queries = sample_queries([row.title for row in rows if row.title], args.queries, rng)
+
+    index = TitleIndex()
+    started = time.perf_counter()
+    index.build(rows)
+    print(f"{len(rows)} titles, {len(index.snapshot.postings)} trigrams, build {time.perf_counter() - started:.2f} s")
+
+    # Ties on the distance may come in any order from the database, so the
+    # comparison is on the distances and on the games strictly closer than
+    # the last one returned
+    scan_latencies, index_latencies, mismatches = [], [], 0
+    async with AsyncSessionLocal() as db:
+        for query in queries:
+            started = time.perf_counter()
+            scanned = await crud.scan_games_by_similar_title(db, query, args.max_distance, args.limit)
+            scan_latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            matches = index.search(query, args.max_distance, args.limit)
+            index_latencies.append(time.perf_counter() - started)
+
+            expected = [(game.id, distance) for game, distance in scanned]
+            distances = [distance for _, distance in matches]
+            closer = {game_id for game_id, distance in matches if distances and distance < distances[-1]}
+            if distances != [distance for _, distance in expected] or \
+                    closer != {game_id for game_id, distance in expected if distances and distance < distances[-1]}:
+                mismatches += 1
+                print(f"mismatch for {query!r}: index {matches[:5]} scan {expected[:5]}")
+    print(f"{len(queries)} queries, limit {args.limit}, {mismatches} mismatches")
+    report("database scan", scan_latencies)
+    report("trigram index", index_latencies)
+
+    if args.copies > 1:
+        larger = [(copy * 10 ** 7 + game_id, f"{title} {copy}" if copy else title)
+                  for copy in range(args.copies) for game_id, title in rows if title]
+        index = TitleIndex()
+        started = time.perf_counter()
+        index.build(larger)
+        print(f"{len(larger)} titles, {len(index.snapshot.postings)} trigrams, build {time.perf_counter() - started:.2f} s")
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, args.max_distance, args.limit)
+            latencies.append(time.perf_counter() - started)
+        report(f"trigram index x{args.copies}", latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+# Title search in the database on a synthetic catalog: the ILIKE plus
+# levenshtein query against the lower(title) LIKE query served by the pg_trgm
+# GIN index (title_search_trgm), with their EXPLAIN ANALYZE plans and the
+# latency of each. The catalog lives in a scratch schema of the given database
+# and is dropped afterwards.
+#
+#   python benchmarks/bench_title_trgm.py --dsn postgresql://localhost/bench --titles 100000
+#
+# The ILIKE mode needs levenshtein (fuzzystrmatch) and the trigram mode needs
+# pg_trgm, a mode is skipped when its function is missing. Queries with words
+# under three characters, which have no trigram, are measured apart: half of
+# them are short words only, half a word and a short one.
+import argparse
+import random
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+SCHEMA = "bench_title_search"
+SYLLABLES = ("ka", "ro", "mi", "tan", "vel", "dor", "shi", "qua", "zen", "bel", "cor", "fal", "gri", "hal", "jun",
+             "lor", "mor", "nex", "pra", "sol", "tor", "ul", "var", "wyn", "xe", "yor", "ze", "ar", "em", "ix")
+
+
+def synthetic_titles(count, rng):
+    vocabulary = sorted({"".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(8000)})
+    # A few words are in many titles, like "war" or "legends"
+    weights = [1 / (rank + 1) ** 0.9 for rank in range(len(vocabulary))]
+    titles = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, weights, k=rng.randint(1, 4))
+        title = " ".join(word.capitalize() for word in words)
+        if rng.random() < 0.2:
+            title += f" {rng.randint(2, 5)}"
+        titles.append(title)
+    return titles
+
+
+def sample_queries(titles, count, rng):
+    queries = []
+    while len(queries) < count:
+        words = rng.choice(titles).lower().split()
+        kind = len(queries) % 3
+        if kind == 0:
+            queries.append(" ".join(words))
+        elif kind == 1:
+            queries.append(rng.choice(words))
+        else:
+            word = rng.choice(words)
+            queries.append(word[:max(3, len(word) - 2)])
+    return queries
+
+
+def sample_short_queries(titles, count, rng):
+    queries = []
+    while len(queries) < count:
+        words = rng.choice(titles).lower().split()
+        word = rng.choice(words)
+        start = rng.randrange(max(len(word) - 1, 1))
+        short = word[start:start + 2]
+        queries.append(short if len(queries) % 2 == 0 else f"{rng.choice(words)} {short}")
+    return queries
+
+
+# The statements of crud.get_games_by_similar_title in each mode
+def scan_query(words, max_distance, limit):
+    filters = " AND ".join(f"title ILIKE :w{n}" for n in range(len(words)))
+    distance = " + ".join(f"levenshtein(lower(title), :v{n})" for n in range(len(words)))
+    sql = (f"SELECT id, title, {distance} AS distance FROM {SCHEMA}.games WHERE {filters} "
+           f"GROUP BY id HAVING {distance} <= :bound ORDER BY distance LIMIT :limit")
+    return sql, bind(words, max_distance, limit)
+
+
+def trgm_query(words, max_distance, limit):
+    filters = " AND ".join(f"lower(title) LIKE :w{n}" if len(word) >= 3 else f"strpos(lower(title), :v{n}) > 0"
+                           for n, word in enumerate(words))
+    distance = f"{len(words)} * char_length(title) - {sum(map(len, words))}"
+    sql = (f"SELECT id, title, {distance} AS distance FROM {SCHEMA}.games WHERE {filters} "
+           f"GROUP BY id HAVING {distance} <= :bound ORDER BY distance LIMIT :limit")
+    return sql, bind(words, max_distance, limit)
+
+
+def bind(words, max_distance, limit):
+    params = {"bound": max_distance * len(words), "limit": limit}
+    for n, word in enumerate(words):
+        params[f"w{n}"] = f"%{word}%"
+        params[f"v{n}"] = word
+    return params
+
+
+# signature such as "levenshtein(text, text)": to_regproc is NULL for overloaded names
+def has_function(connection, signature):
+    return connection.execute(text("SELECT to_regprocedure(:signature) IS NOT NULL"), {"signature": signature}).scalar()
+
+
+def create_extension(connection, name):
+    try:
+        with connection.begin_nested():
+            connection.execute(text(f"CREATE EXTENSION IF NOT EXISTS {name}"))
+    except DBAPIError as error:
+        print(f"extension {name} unavailable: {error.orig}".strip())
+
+
+def measure(connection, build, queries, max_distance, limit):
+    latencies, results = [], []
+    for query in queries:
+        sql, params = build(query.split(), max_distance, limit)
+        started = time.perf_counter()
+        rows = connection.execute(text(sql), params).all()
+        latencies.append(time.perf_counter() - started)
+        results.append(sorted(row.distance for row in rows))
+    return np.array(latencies) * 1000, results
+
+
+def explain(connection, build, query, max_distance, limit):
+    sql, params = build(query.split(), max_distance, limit)
+    plan = connection.execute(text("EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + sql), params).scalars().all()
+    print(f"EXPLAIN {query!r}")
+    print("\n".join("    " + line for line in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", required=True, help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--titles", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--short-queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--max-distance", type=int, default=40)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    engine = create_engine(args.dsn)
+    titles = synthetic_titles(args.titles, rng)
+    queries = sample_queries(titles, args.queries, rng)
+    short_queries = sample_short_queries(titles, args.short_queries, rng)
+    with engine.connect() as connection:
+        create_extension(connection, "fuzzystrmatch")
+        create_extension(connection, "pg_trgm")
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text(f"CREATE TABLE {SCHEMA}.games (id integer PRIMARY KEY, title text NOT NULL)"))
+        connection.execute(text(f"INSERT INTO {SCHEMA}.games VALUES (:id, :title)"),
+                           [{"id": n, "title": title} for n, title in enumerate(titles)])
+        connection.commit()
+        try:
+            connection.execute(text(f"ANALYZE {SCHEMA}.games"))
+            connection.commit()
+            print(f"{len(titles)} titles, {len(queries)} queries, {len(short_queries)} with short words, "
+                  f"limit {args.limit}")
+            results = {}
+
+            def run(label, build, explain_short=False):
+                explain(connection, build, queries[1], args.max_distance, args.limit)
+                if explain_short:
+                    explain(connection, build, short_queries[0], args.max_distance, args.limit)
+                    explain(connection, build, short_queries[1], args.max_distance, args.limit)
+                groups = (("", queries), ("short only", short_queries[0::2]), ("word + short", short_queries[1::2]))
+                for group, group_queries in groups:
+                    latencies, distances = measure(connection, build, group_queries, args.max_distance, args.limit)
+                    results.setdefault(label, []).extend(distances)
+                    print(f"{label:<20} {group:<12} p50 {np.percentile(latencies, 50):8.2f} ms   "
+                          f"p99 {np.percentile(latencies, 99):8.2f} ms")
+
+            if has_function(connection, "levenshtein(text, text)"):
+                run("ilike + levenshtein", scan_query)
+            else:
+                print("levenshtein missing, the ILIKE mode is skipped")
+            # The trigram mode's statement before the index exists
+            run("lower like, no index", trgm_query)
+            if has_function(connection, "similarity(text, text)"):
+                started = time.perf_counter()
+                connection.execute(text(
+                    f"CREATE INDEX games_title_trgm_idx ON {SCHEMA}.games USING gin (lower(title) gin_trgm_ops)"))
+                connection.execute(text(f"ANALYZE {SCHEMA}.games"))
+                connection.commit()
+                print(f"GIN index built in {time.perf_counter() - started:.2f} s")
+                run("pg_trgm", trgm_query, explain_short=True)
+            else:
+                print("pg_trgm missing, the trigram mode is skipped")
+
+            (first, baseline), *others = results.items()
+            for label, distances in others:
+                different = sum(a != b for a, b in zip(baseline, distances))
+                print(f"{label:<20} {different} queries with other distances than {first}")
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+            connection.commit()
+
+
+if __name__ == "__main__":
+    main()
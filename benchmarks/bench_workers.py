@@ -0,0 +1,108 @@
+# Memory and tail latency of N worker processes serving the same FAISS index,
+# each with a private in-memory copy versus one read-only memory-mapped file
+# (settings.faiss_mmap).
+#
+#   python benchmarks/bench_workers.py --games 67000 --workers 1 4 8
+#
+# Memory is reported as the summed PSS of the workers (shared pages are split
+# between the processes that map them), next to the summed RSS.
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bench_index_load import build_index  # noqa: E402
+
+
+def memory_kib(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def worker(path, mmap, nprobe, queries, k, ready, start, results):
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(path, flags)
+    index.nprobe = nprobe
+    if mmap:
+        # Same as FaissIndexManager: no prefetch threads on mapped lists
+        faiss.downcast_InvertedLists(index.invlists).prefetch_nthread = 0
+    faiss.omp_set_num_threads(1)
+    # Warm up: touch every inverted list once
+    index.search(queries, k)
+    ready.set()
+    start.wait()
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+    results.put(latencies)
+
+
+def run(path, mmap, workers, nprobe, queries, k):
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    processes, ready_events = [], []
+    for _ in range(workers):
+        ready = context.Event()
+        process = context.Process(target=worker, args=(path, mmap, nprobe, queries, k, ready, start, results))
+        process.start()
+        processes.append(process)
+        ready_events.append(ready)
+    for ready in ready_events:
+        ready.wait()
+
+    memory = [memory_kib(process.pid) for process in processes]
+    start.set()
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get())
+    for process in processes:
+        process.join()
+
+    return {
+        "rss_mib": sum(item["Rss"] for item in memory) / 1024,
+        "pss_mib": sum(item["Pss"] for item in memory) / 1024,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=67000)
+    parser.add_argument("--nlist", type=int, default=670)
+    parser.add_argument("--nprobe", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "games.index")
+        vectors = build_index(path, args.games, args.nlist)
+        queries = vectors[np.random.default_rng(1).integers(0, len(vectors), args.queries)]
+        print(f"index: {args.games} vectors, {os.path.getsize(path) / 2**20:.1f} MiB on disk")
+        print(f"{'mode':>8} {'workers':>7} {'RSS MiB':>9} {'PSS MiB':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for workers in args.workers:
+            for mode in ("private", "mmap"):
+                result = run(path, mode == "mmap", workers, args.nprobe, queries, args.k)
+                print(f"{mode:>8} {workers:>7} {result['rss_mib']:>9.1f} {result['pss_mib']:>9.1f} "
+                      f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+-- Track when each game changes so the FAISS index can be updated
+-- incrementally instead of retrained from scratch.
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION games_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS games_touch_updated_at ON games;
+CREATE TRIGGER games_touch_updated_at
+    BEFORE UPDATE ON games
+    FOR EACH ROW EXECUTE FUNCTION games_touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS games_updated_at_idx ON games (updated_at);
@@ -0,0 +1,28 @@
+-- Precomputed genre and engine bits of each game (GameEncoder.feature_bits),
+-- so encoding reads ready-made codes instead of parsing the genres and
+-- detected_technologies strings. Filled by the ingestion step:
+--
+--   python -m app.features          games without bits
+--   python -m app.features --all    every game, after the vocabularies change
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS feature_bits bytea;
+
+-- Bits computed from the old strings are stale, they are dropped until the
+-- next ingestion run (readers parse the strings meanwhile). Updates that
+-- write the bits themselves keep them.
+CREATE OR REPLACE FUNCTION games_reset_feature_bits() RETURNS trigger AS $$
+BEGIN
+    IF NEW.feature_bits IS NOT DISTINCT FROM OLD.feature_bits THEN
+        NEW.feature_bits := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS games_reset_feature_bits ON games;
+CREATE TRIGGER games_reset_feature_bits
+    BEFORE UPDATE OF genres, detected_technologies ON games
+    FOR EACH ROW
+    WHEN (NEW.genres IS DISTINCT FROM OLD.genres
+          OR NEW.detected_technologies IS DISTINCT FROM OLD.detected_technologies)
+    EXECUTE FUNCTION games_reset_feature_bits();
@@ -0,0 +1,11 @@
+-- Trigram index on the lowercase titles for the title search queries run
+-- with title_search_trgm: lower(title) LIKE '%word%' is answered from the
+-- index instead of reading every game. Needs the pg_trgm contrib extension.
+--
+-- CONCURRENTLY keeps the games table writable while the index builds, so
+-- this file is run outside a transaction block (psql -f, not -1).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS games_title_trgm_idx
+    ON games USING gin (lower(title) gin_trgm_ops);
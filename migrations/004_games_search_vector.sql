@@ -0,0 +1,18 @@
+-- Full-text search over title, developer and publisher (GET /games/search):
+-- a stored generated tsvector, so every write keeps it current, with the
+-- title weighted above the developer and the developer above the publisher.
+-- The 'english' configuration must match crud.FULL_TEXT_CONFIG.
+--
+-- Adding the column rewrites the table under an exclusive lock. The index is
+-- built CONCURRENTLY, so this file is run outside a transaction block (psql
+-- -f, not -1).
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(developer, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(publisher, '')), 'C')
+    ) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS games_search_vector_idx
+    ON games USING gin (search_vector);
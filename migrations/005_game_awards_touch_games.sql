@@ -0,0 +1,40 @@
+-- A game's awards are part of its encoded vector, so adding, moving or
+-- removing a game_awards row, or renaming an award, bumps updated_at of the
+-- games concerned (through games_touch_updated_at). The incremental index
+-- update and the catalog watcher then see them as changed games.
+
+CREATE OR REPLACE FUNCTION game_awards_touch_games() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE games SET updated_at = now() WHERE id = OLD.game_id;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        UPDATE games SET updated_at = now() WHERE id = NEW.game_id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        IF NEW.game_id IS DISTINCT FROM OLD.game_id THEN
+            UPDATE games SET updated_at = now() WHERE id = NEW.game_id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS game_awards_touch_games ON game_awards;
+CREATE TRIGGER game_awards_touch_games
+    AFTER INSERT OR UPDATE OR DELETE ON game_awards
+    FOR EACH ROW EXECUTE FUNCTION game_awards_touch_games();
+
+CREATE OR REPLACE FUNCTION awards_touch_games() RETURNS trigger AS $$
+BEGIN
+    UPDATE games SET updated_at = now()
+    WHERE id IN (SELECT game_id FROM game_awards WHERE award_id = NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS awards_touch_games ON awards;
+CREATE TRIGGER awards_touch_games
+    AFTER UPDATE OF name ON awards
+    FOR EACH ROW
+    WHEN (NEW.name IS DISTINCT FROM OLD.name)
+    EXECUTE FUNCTION awards_touch_games();